@@ -2,17 +2,241 @@ import os
 import time
 import sys
 import re
-from selenium import webdriver
-from selenium.webdriver.edge.service import Service as EdgeService
-from selenium.webdriver.edge.options import Options as EdgeOptions
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import threading
+
+# Selenium / webdriver-manager are imported inside make_edge_driver() so the
+# batch logic below can run against a stand-in driver without them.
+# Optional: `pip install watchdog` for event-driven download detection.
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Adaptive batch sizing
+INITIAL_BATCH_SIZE = 10
+MIN_BATCH_SIZE = 5
+MAX_BATCH_SIZE = 50
+
+# Browser download artifacts: a file is not finished while one of these exists
+TEMP_SUFFIXES = ('.crdownload', '.tmp', '.partial', '.opdownload', '.download')
+
+# Without watchdog, fall back to re-checking the folder this often (seconds)
+FALLBACK_POLL_INTERVAL = 1.0
+
+# selenium.webdriver.common.by.By values, spelled out to avoid the import
+BY_CSS = "css selector"
+BY_CLASS = "class name"
+BY_XPATH = "xpath"
+
+class DriverUnavailable(Exception):
+    pass
 
 def safe_join_paths(paths):
     return "\n".join(paths)
 
+def make_edge_driver(base_dir, output_dir):
+    """ Headless Edge configured to download straight into output_dir """
+    from selenium import webdriver
+    from selenium.webdriver.edge.service import Service as EdgeService
+    from selenium.webdriver.edge.options import Options as EdgeOptions
+    from webdriver_manager.microsoft import EdgeChromiumDriverManager
+
+    options = EdgeOptions()
+    prefs = {
+        "download.default_directory": output_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+        "profile.default_content_settings.popups": 0
+    }
+    options.add_experimental_option("prefs", prefs)
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--log-level=3")
+
+    local_driver = os.path.join(base_dir, "msedgedriver.exe")
+    if os.path.exists(local_driver):
+        service = EdgeService(executable_path=local_driver)
+    else:
+        # Driver fallback logic
+        try:
+            service = EdgeService(EdgeChromiumDriverManager().install())
+        except Exception as e:
+            raise DriverUnavailable(f"Driver not found and download failed: {e}")
+
+    driver = webdriver.Edge(service=service, options=options)
+    # Headless Chromium ignores download prefs unless downloads are allowed explicitly
+    try:
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": output_dir})
+    except Exception:
+        pass
+    return driver
+
+def wait_until(fn, timeout, interval=0.2):
+    """ Call fn until it returns something truthy (UI waits only) """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            result = fn()
+            if result:
+                return result
+        except Exception:
+            pass
+        if time.time() >= deadline:
+            raise TimeoutError(f"condition not met within {timeout}s")
+        time.sleep(interval)
+
+class BrowserSession:
+    """ One browser kept alive across batches; the page is reloaded between them """
+
+    def __init__(self, driver_factory, app_url):
+        self.driver_factory = driver_factory
+        self.app_url = app_url
+        self.driver = driver_factory()
+
+    def reset(self):
+        self.driver.get(self.app_url)
+        wait_until(lambda: self.driver.find_elements(BY_CSS, "input[type='file']"), 15)
+
+    def send_files(self, paths):
+        try:
+            file_input = self.driver.find_element(BY_CSS, "input[type='file']")
+        except Exception:
+            print("[!] Could not find file input element on the page.")
+            print("Dumping page source for debug...")
+            print(self.driver.page_source[:500])
+            raise
+        file_input.send_keys(safe_join_paths(paths))
+
+    def download_all(self, expected_rows):
+        # Wait for one row per file sent; if some never show up, download the ones that did
+        def rows():
+            return len(self.driver.find_elements(BY_CLASS, "el-table__row"))
+
+        try:
+            wait_until(lambda: rows() >= expected_rows, 30)
+            print(f"[+] All {expected_rows} unlocked files appeared in the list.")
+        except TimeoutError:
+            found = rows()
+            if not found:
+                raise
+            print(f"[!] Only {found}/{expected_rows} files appeared in the list; downloading those.")
+
+        def clickable_button():
+            for btn in self.driver.find_elements(BY_XPATH, "//button[contains(., '下载全部')]"):
+                if btn.is_displayed() and btn.is_enabled():
+                    return btn
+            return None
+
+        wait_until(clickable_button, 10).click()
+
+    def restart(self):
+        self.close()
+        self.driver = self.driver_factory()
+
+    def close(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+class _DirEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        self.watcher.notify()
+
+class DownloadWatcher:
+    """
+    Tracks files appearing in output_dir. Finished downloads are new files
+    without a temp suffix; in-progress ones are tracked by their temp names.
+    Wakes up on filesystem events (watchdog) instead of fixed sleeps.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.cond = threading.Condition()
+        self.changes = 0
+        self.baseline = set()
+        self.observer = None
+        if Observer is not None:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(_DirEventHandler(self), output_dir, recursive=False)
+                self.observer.start()
+            except Exception as e:
+                print(f"[!] File watcher unavailable ({e}); falling back to periodic checks.")
+                self.observer = None
+
+    def notify(self):
+        with self.cond:
+            self.changes += 1
+            self.cond.notify_all()
+
+    def _listing(self):
+        return set(f for f in os.listdir(self.output_dir) if not f.endswith('.log'))
+
+    def mark(self):
+        """ Remember what is already there before a batch starts """
+        self.baseline = self._listing()
+
+    def state(self):
+        """ (finished new files, in-progress temp files) since mark() """
+        new = self._listing() - self.baseline
+        pending = set(f for f in new if f.lower().endswith(TEMP_SUFFIXES))
+        return new - pending, pending
+
+    def wait_for(self, expected, timeout):
+        deadline = time.time() + timeout
+        poll = None if self.observer is not None else FALLBACK_POLL_INTERVAL
+        while True:
+            with self.cond:
+                seen = self.changes
+            finished, pending = self.state()
+            if len(finished) >= expected and not pending:
+                return finished, pending
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return finished, pending
+            with self.cond:
+                if self.changes == seen:
+                    self.cond.wait(remaining if poll is None else min(poll, remaining))
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+
+class AdaptiveBatcher:
+    """
+    Grows the batch while files/second keeps improving, shrinks it when a
+    batch fails or throughput drops, so the fixed per-batch cost (page
+    reload, UI waits) is spread over as many files as the browser handles well.
+    """
+
+    def __init__(self, size=INITIAL_BATCH_SIZE, min_size=MIN_BATCH_SIZE, max_size=MAX_BATCH_SIZE):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.best_rate = 0.0
+
+    def record(self, sent, received, seconds):
+        rate = received / seconds if seconds > 0 else 0.0
+        if received < sent:
+            self.size = max(self.min_size, self.size // 2)
+        elif rate >= self.best_rate:
+            self.size = min(self.max_size, self.size + max(1, self.size // 2))
+        elif rate < self.best_rate * 0.8:
+            self.size = max(self.min_size, (self.size * 2) // 3)
+        self.best_rate = max(self.best_rate, rate)
+        print(f"[Batch] {received}/{sent} files in {seconds:.1f}s ({rate:.2f} files/s). Next batch size: {self.size}")
+
 def main():
     print("=== Browser-based Batch Unlocker ===")
     print("Uses Selenium to drive the Dist/index.html web app locally.")
@@ -138,128 +362,86 @@ def main():
 
     # --- BATCH PROCESSING ---
     
-    BATCH_SIZE = 10 
-    total_to_do = len(files_to_process)
-    failed_log_path = os.path.join(output_dir, "failed.log")
+    print(f"Ready to process {len(files_to_process)} files in adaptive batches (start: {INITIAL_BATCH_SIZE})...")
+    print("Starting headless browser session (reused for all batches)...")
     
-    print(f"Ready to process {total_to_do} files in batches of {BATCH_SIZE}...")
+    session = None
+    watcher = DownloadWatcher(output_dir)
+    try:
+        session = BrowserSession(lambda: make_edge_driver(base_dir, output_dir), app_url)
+        run_batches(files_to_process, session, watcher, AdaptiveBatcher(), history_path)
+    except DriverUnavailable as e:
+        print(f"[!] Fatal: {e}")
+        return
+    finally:
+        watcher.stop()
+        if session:
+            print("Closing browser session...")
+            session.close()
+
+    print("\n[Done] All batches processed.")
+
+def run_batches(files_to_process, session, watcher, batcher, history_path):
+    """
+    Feed files through one browser session in adaptively sized batches.
+    session/watcher are duck-typed so a stand-in driver and a fake download
+    writer can drive this without a real browser.
+    """
+    output_dir = watcher.output_dir
+    total_to_do = len(files_to_process)
+    done = 0
+    batch_num = 0
     
-    for i in range(0, total_to_do, BATCH_SIZE):
-        batch = files_to_process[i : i + BATCH_SIZE]
-        batch_num = i // BATCH_SIZE + 1
-        total_batches = (total_to_do + BATCH_SIZE - 1) // BATCH_SIZE
+    while done < total_to_do:
+        batch = files_to_process[done : done + batcher.size]
+        done += len(batch)
+        batch_num += 1
         
-        print(f"\n=== Starting Batch {batch_num}/{total_batches} (Size: {len(batch)}) ===")
-        print("Initializing new browser session...")
+        print(f"\n=== Starting Batch {batch_num} ({done}/{total_to_do} queued, Size: {len(batch)}) ===")
+        batch_start = time.time()
+        download_success = False
+        new_files_count = 0
         
-        driver = None
         try:
-            # 1. Setup Driver
-            options = EdgeOptions()
-            prefs = {
-                "download.default_directory": output_dir,
-                "download.prompt_for_download": False,
-                "download.directory_upgrade": True,
-                "safebrowsing.enabled": True,
-                "profile.default_content_settings.popups": 0
-            }
-            options.add_experimental_option("prefs", prefs)
-            options.add_argument("--disable-gpu")
-            options.add_argument("--log-level=3")
-
-            service = None
-            local_driver = os.path.join(base_dir, "msedgedriver.exe")
-            if os.path.exists(local_driver):
-                service = EdgeService(executable_path=local_driver)
-            else:
-                # Driver fallback logic
-                try:
-                    service = EdgeService(EdgeChromiumDriverManager().install())
-                except:
-                   print("[!] Fatal: Driver not found and download failed.")
-                   return
-
-            driver = webdriver.Edge(service=service, options=options)
-            
-            # 2. Load App
-            driver.get(app_url)
-            time.sleep(2)
-            
-            # 3. Find Input & Send
-            try:
-                file_input = driver.find_element(By.CSS_SELECTOR, "input[type='file']")
-                print("[+] Found file input element.")
-            except:
-                print("[!] Could not find file input element on the page.")
-                print("Dumping page source for debug...")
-                print(driver.page_source[:500])
-                raise # Re-raise to trigger finally and quit driver
+            # 1. Fresh page in the existing session
+            session.reset()
             
             # Capture output state BEFORE sending files
-            initial_files_state = set(f for f in os.listdir(output_dir) if f != "processed.log")
-
-            # 4. Send Files
-            file_string = safe_join_paths(batch)
-            file_input.send_keys(file_string)
+            watcher.mark()
             
-            # 5. Wait for processing & Click Download
-            print(f"Files sent. Waiting for decryption...")
+            # 2. Send Files
+            session.send_files(batch)
             
+            # 3. Wait for processing & Click Download
+            print(f"Files sent. Waiting for decryption...")
             try:
-                # Wait for at least one row in the table to confirm processing started/finished
-                WebDriverWait(driver, 30).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "el-table__row"))
-                )
-                print("[+] Unlocked files appeared in the list.")
-                
-                # Check for "Download All" button
-                download_btn = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, "//button[contains(., '下载全部')]"))
-                )
-                print("[+] Found 'Download All' button. Clicking...")
-                download_btn.click()
-                
+                session.download_all(len(batch))
+                print("[+] Clicked 'Download All'.")
             except Exception as e:
                 print(f"[!] Warning: UI interaction failed: {e}")
-                print("    (The script will wait a bit and move to next batch, hoping auto-download worked if configured...)")
-
-            # 6. Wait for download completion (Smart Wait)
-            # We track the output directory to verify files arrived
-            start_wait = time.time()
-            max_wait_per_batch = max(60, len(batch) * 5) # Minimum 60s or 5s per file
-            
-            download_success = False
-            new_files_count = 0
-            
-            print(f"Monitoring output directory for {len(batch)} new files (Timeout: {max_wait_per_batch}s)...")
+                print("    (Still watching the output folder in case auto-download worked...)")
             
-            while time.time() - start_wait < max_wait_per_batch:
-                current_files = set(f for f in os.listdir(output_dir) if f != "processed.log")
-                new_files = current_files - initial_files_state
-                new_files_count = len(new_files)
-                
-                if new_files_count >= len(batch):
-                    print(f"[+] Success: Detected {new_files_count} new files.")
-                    download_success = True
-                    break
-                
-                time.sleep(2)
+            # 4. Wait for downloads to finish (filesystem events, not sleeps)
+            max_wait_per_batch = max(60, len(batch) * 5) # Minimum 60s or 5s per file
+            print(f"Watching output directory for {len(batch)} new files (Timeout: {max_wait_per_batch}s)...")
+            finished, pending = watcher.wait_for(len(batch), max_wait_per_batch)
+            new_files_count = len(finished)
+            download_success = new_files_count >= len(batch)
             
-            if not download_success:
-                print(f"[!] Warning: Timeout reached. Expected {len(batch)} files, found {new_files_count}.")
+            if download_success:
+                print(f"[+] Success: Detected {new_files_count} new files.")
+            else:
+                print(f"[!] Warning: Timeout reached. Expected {len(batch)} files, found {new_files_count}"
+                      f" ({len(pending)} still downloading).")
                 if new_files_count == 0:
                     print("[!] No files downloaded. NOT scanning batch as processed.")
                 else:
                     print("[!] Partial batch detected. NOT scanning batch as processed to allow retry.")
             
-            # 7. Log success ONLY if downloads confirmed
-            if download_success or (new_files_count > 0 and new_files_count >= len(batch) - 2): 
-                # Relaxed condition: If we got most of them (e.g. 8/10), we log them to avoid stuck loops.
-                # But strictly, user wants results. Let's use strict success for now or very close.
-                # Actually, let's stick to strict logic for "all or nothing" to be safe, 
-                # but if the user wants to force progress, they can manually check.
-                # Given the "download all" button behavior, it's usually all or nothing.
-                
+            # 5. Log success ONLY if downloads confirmed
+            # Relaxed condition: if we got most of them (e.g. 8/10), log them to avoid stuck loops.
+            # Given the "download all" button behavior, it's usually all or nothing.
+            if download_success or (new_files_count > 0 and new_files_count >= len(batch) - 2):
                 if not download_success:
                      print("[?] Marking as processed despite partial mismatch (tolerance).")
 
@@ -272,20 +454,18 @@ def main():
             
             print(f"Batch {batch_num} completed.")
             
+        except DriverUnavailable:
+            raise
         except Exception as e:
             print(f"[!] Error in batch {batch_num}: {e}")
+            print("Restarting browser session...")
+            session.restart()
         
         finally:
             # --- Micro-Cleanup: Prevent (1) duplicates immediately ---
             run_micro_cleanup(output_dir)
-
-            if driver:
-                print("Closing browser session...")
-                driver.quit()
-                # Wait a moment for disk IO to release
-                time.sleep(2)
-
-    print("\n[Done] All batches processed.")
+        
+        batcher.record(len(batch), new_files_count, time.time() - batch_start)
 
 def run_micro_cleanup(output_dir):
     """ Quick duplication fix logic used after each batch """
@@ -0,0 +1,160 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import browser_unlock as bu
+
+# Drives run_batches() with a stand-in for the Edge driver and a fake
+# download writer, so the batch/watch/log logic is checked without a browser.
+# Run: python -m unittest legacy/test_browser_unlock.py
+
+
+class FakeDownloadWriter:
+    """ Writes one output per sent file the way a browser does: <name>.crdownload, then renamed """
+
+    def __init__(self, output_dir, delay=0.05):
+        self.output_dir = output_dir
+        self.delay = delay
+        self.threads = []
+
+    def start(self, paths):
+        t = threading.Thread(target=self._write, args=(list(paths),))
+        t.start()
+        self.threads.append(t)
+
+    def _write(self, paths):
+        for path in paths:
+            final = os.path.join(self.output_dir, os.path.splitext(os.path.basename(path))[0] + ".flac")
+            with open(final + ".crdownload", "wb") as f:
+                f.write(b"fLaC")
+            time.sleep(self.delay)
+            os.replace(final + ".crdownload", final)
+
+    def join(self):
+        for t in self.threads:
+            t.join()
+
+
+class _FileInput:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def send_keys(self, text):
+        if self.driver.fail_next_send:
+            self.driver.fail_next_send = False
+            raise RuntimeError("session crashed")
+        self.driver.sent = text.split("\n")
+
+
+class _Button:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.driver.writer.start(self.driver.sent)
+
+
+class FakeDriver:
+    """ The parts of the Selenium WebDriver API that BrowserSession uses """
+
+    page_source = "<html></html>"
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.sent = []
+        self.fail_next_send = False
+        self.loads = 0
+        self.quit_called = False
+
+    def get(self, url):
+        self.loads += 1
+        self.sent = []
+
+    def find_elements(self, by, selector):
+        if by == bu.BY_CSS:
+            return [_FileInput(self)]
+        if by == bu.BY_CLASS:
+            return [object() for _ in self.sent]
+        if by == bu.BY_XPATH:
+            return [_Button(self)] if self.sent else []
+        return []
+
+    def find_element(self, by, selector):
+        return self.find_elements(by, selector)[0]
+
+    def quit(self):
+        self.quit_called = True
+
+
+class RunBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp, "output")
+        os.makedirs(self.output_dir)
+        self.history_path = os.path.join(self.output_dir, "processed.log")
+        self.files = [os.path.join(self.tmp, f"song{i:02d}.ncm") for i in range(12)]
+        self.writer = FakeDownloadWriter(self.output_dir)
+        self.drivers = []
+        self.session = bu.BrowserSession(self._new_driver, "file:///Dist/index.html")
+        self.watcher = bu.DownloadWatcher(self.output_dir)
+        self._poll = bu.FALLBACK_POLL_INTERVAL
+        bu.FALLBACK_POLL_INTERVAL = 0.02
+
+    def tearDown(self):
+        bu.FALLBACK_POLL_INTERVAL = self._poll
+        self.watcher.stop()
+        self.session.close()
+        self.writer.join()
+        shutil.rmtree(self.tmp)
+
+    def _new_driver(self):
+        driver = FakeDriver(self.writer)
+        self.drivers.append(driver)
+        return driver
+
+    def _logged(self):
+        with open(self.history_path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def test_all_batches_logged_in_one_session(self):
+        batcher = bu.AdaptiveBatcher(size=5)
+        bu.run_batches(self.files, self.session, self.watcher, batcher, self.history_path)
+
+        self.assertEqual(self._logged(), [os.path.basename(p) for p in self.files])
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         sorted([f"song{i:02d}.flac" for i in range(12)] + ["processed.log"]))
+        # One browser for the whole run, one page load per batch (5 + 7)
+        self.assertEqual(len(self.drivers), 1)
+        self.assertEqual(self.drivers[0].loads, 2)
+        self.assertGreater(batcher.size, 5)
+
+    def test_crashed_batch_restarts_session_and_is_not_logged(self):
+        batcher = bu.AdaptiveBatcher(size=5)
+        self.session.driver.fail_next_send = True
+        bu.run_batches(self.files, self.session, self.watcher, batcher, self.history_path)
+
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+        self.assertEqual(self._logged(), [os.path.basename(p) for p in self.files[5:]])
+
+    def test_watcher_waits_for_temp_files(self):
+        self.watcher.mark()
+        self.writer.start(self.files[:3])
+        finished, pending = self.watcher.wait_for(3, 10)
+        self.assertEqual(len(finished), 3)
+        self.assertFalse(pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,8 @@
+import sys
+
+# Build or refresh the library index (see unlock_music/library_index.py).
+
+from unlock_music.library_index import main
+
+if __name__ == "__main__":
+    sys.exit(main())
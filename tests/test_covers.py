@@ -0,0 +1,65 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.covers import CoverStore
+
+# Run: python -m unittest tests/test_covers.py
+
+JPEG_A = b"\xff\xd8\xff" + b"a" * 50
+JPEG_B = b"\xff\xd8\xff" + b"b" * 50
+
+
+class FolderArtTest(unittest.TestCase):
+    def setUp(self):
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest)
+
+    def _album(self, *parts):
+        path = os.path.join(self.dest, "Converted", *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _art(self, album_dir):
+        with open(os.path.join(album_dir, "folder.jpg"), "rb") as f:
+            return f.read()
+
+    def test_same_folder_name_in_two_places(self):
+        store = CoverStore(self.dest)
+        a = self._album("Greatest Hits")
+        b = self._album("Various", "Greatest Hits")
+        self.assertTrue(store.write_folder_art(a, store.add(JPEG_A, ".jpg")))
+        self.assertTrue(store.write_folder_art(b, store.add(JPEG_B, ".jpg")))
+        self.assertEqual((self._art(a), self._art(b)), (JPEG_A, JPEG_B))
+
+    def test_new_cover_in_a_later_run_replaces_the_art(self):
+        album = self._album("A - Hits")
+        store = CoverStore(self.dest)
+        store.write_folder_art(album, store.add(JPEG_A, ".jpg"))
+        # Within a run the first cover wins
+        self.assertFalse(store.write_folder_art(album, store.add(JPEG_B, ".jpg")))
+        store.save()
+
+        store = CoverStore(self.dest)
+        self.assertFalse(store.write_folder_art(album, store.add(JPEG_A, ".jpg")))
+        store = CoverStore(self.dest)
+        self.assertTrue(store.write_folder_art(album, store.add(JPEG_B, ".jpg")))
+        self.assertEqual(self._art(album), JPEG_B)
+
+    def test_existing_art_is_left_alone(self):
+        album = self._album("A - Hits")
+        with open(os.path.join(album, "folder.jpg"), "wb") as f:
+            f.write(b"mine")
+        store = CoverStore(self.dest)
+        self.assertFalse(store.write_folder_art(album, store.add(JPEG_A, ".jpg")))
+        store.save()
+        store = CoverStore(self.dest)
+        self.assertFalse(store.write_folder_art(album, store.add(JPEG_B, ".jpg")))
+        self.assertEqual(self._art(album), b"mine")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.clean import run_clean
+from unlock_music.dirsnap import SnapshotCache
+
+# Run: python -m unittest tests/test_dirsnap.py
+
+OLD = time.time() - 3600  # a folder mtime well outside the racy window
+
+
+class SnapshotCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.folder = os.path.join(self.tmp, "music")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        for name in ("a.ncm", "b.ncm"):
+            self._write(name, b"x" * 10)
+        self._settle(OLD)
+        self.cache_path = os.path.join(self.tmp, "dirsnap.json")
+
+    def _write(self, name, data):
+        with open(os.path.join(self.folder, name), "wb") as f:
+            f.write(data)
+
+    def _settle(self, mtime):
+        os.utime(self.folder, (mtime, mtime))
+
+    def _run(self):
+        """ One run: a fresh cache loaded from disk. Returns (cache, snapshot) after saving. """
+        cache = SnapshotCache(self.cache_path)
+        snap = cache.get(self.folder)
+        cache.save()
+        return cache, snap
+
+    def test_listing_reused_while_mtime_unchanged(self):
+        cache, snap = self._run()
+        self.assertEqual((cache.listed, cache.reused), (1, 0))
+        self.assertEqual((snap.names(), snap.dirs, snap.size("a.ncm")), (["a.ncm", "b.ncm"], {"sub"}, 10))
+
+        # Slipped in without touching the folder mtime: proves the stored listing is used
+        self._write("c.ncm", b"")
+        self._settle(OLD)
+        cache, snap = self._run()
+        self.assertEqual((cache.listed, cache.reused), (0, 1))
+        self.assertEqual(snap.names(), ["a.ncm", "b.ncm"])
+
+    def test_relisted_when_mtime_changes(self):
+        self._run()
+        os.remove(os.path.join(self.folder, "b.ncm"))
+        self._settle(OLD + 10)
+        cache, snap = self._run()
+        self.assertEqual((cache.listed, cache.reused), (1, 0))
+        self.assertEqual(snap.names(), ["a.ncm"])
+
+    def test_racy_listing_is_not_persisted(self):
+        self._settle(time.time())
+        self._run()
+        self._settle(time.time())
+        cache, _ = self._run()
+        self.assertEqual((cache.listed, cache.reused), (1, 0))
+
+    def test_folder_modified_by_the_run_is_not_persisted(self):
+        cache = SnapshotCache(self.cache_path)
+        snap = cache.get(self.folder)
+        os.remove(os.path.join(self.folder, "a.ncm"))
+        snap.removed("a.ncm")
+        cache.save()
+        self._settle(OLD)
+        cache, snap = self._run()
+        self.assertEqual((cache.listed, cache.reused), (1, 0))
+        self.assertEqual(snap.names(), ["b.ncm"])
+
+
+class CleanRestatTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.output = os.path.join(self.tmp, "output")
+        os.makedirs(self.output)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.output, name), "wb") as f:
+            f.write(data)
+
+    def test_file_that_changed_since_the_scan_is_not_deleted(self):
+        self._write("Song.flac", b"a" * 100)
+        self._write("Song (1).flac", b"a" * 100)
+        snapshots = SnapshotCache(None)
+        snapshots.get(self.output)
+        # Still being written after the listing was taken
+        self._write("Song (1).flac", b"a" * 500)
+
+        result = run_clean(self.tmp, snapshots=snapshots)
+        self.assertEqual(result.deleted, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.output, "Song (1).flac")))
+
+    def test_unchanged_duplicate_is_deleted(self):
+        self._write("Song.flac", b"a" * 100)
+        self._write("Song (1).flac", b"a" * 100)
+        result = run_clean(self.tmp, snapshots=SnapshotCache(None))
+        self.assertEqual(result.deleted, 1)
+        self.assertEqual(sorted(os.listdir(self.output)), ["Song.flac", "processed.log"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.failures import (PERMANENT, TRANSIENT, NegativeCache, classify, format_failed_line,
+                                   keys_fingerprint, last_error_line, load_failed_log, parse_failed_line,
+                                   write_failed_log)
+
+# Run: python -m unittest tests/test_failures.py
+
+ZAP_FATAL = ("\x1b[31mFATAL\x1b[0m\tum/main.go:312\tfailed to decode file\t"
+             "{\"source\": \"/dl/Song (1).ncm\", \"error\": \"open /dl/Song (1).ncm: permission denied\"}")
+
+
+class FailedLogTest(unittest.TestCase):
+    def test_round_trip_with_parentheses_in_name_and_detail(self):
+        detail = last_error_line("INFO\tstarting\n" + ZAP_FATAL + "\n")
+        line = format_failed_line("Song (1).ncm", TRANSIENT, "io-error", detail)
+
+        name, note = parse_failed_line(line)
+        self.assertEqual(name, "Song (1).ncm")
+        self.assertTrue(note.startswith("transient: io-error - FATAL"))
+        self.assertNotIn("\x1b", line)
+
+    def test_old_lines_with_parenthesised_detail(self):
+        self.assertEqual(parse_failed_line("Song.ncm (transient: io-error - read x (y))\n"),
+                         ("Song.ncm", "transient: io-error - read x (y)"))
+        self.assertEqual(parse_failed_line("Song (Live).ncm (crashed)"), ("Song (Live).ncm", "crashed"))
+        self.assertEqual(parse_failed_line("Song (Live).ncm"), ("Song (Live).ncm", ""))
+
+    def test_log_keys_are_file_names(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "failed.log")
+        line = format_failed_line("A (2).mflac", PERMANENT, "key-missing", "read /x/A (2).mflac (EOF)")
+        write_failed_log(path, {"A (2).mflac": line})
+        self.assertEqual(list(load_failed_log(path)), ["A (2).mflac"])
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_rules(self):
+        self.assertEqual(classify(1, "FATAL ekey missing"), (PERMANENT, "key-missing"))
+        self.assertEqual(classify(1, "No suitable decoder found"), (PERMANENT, "unsupported"))
+        self.assertEqual(classify(1, "no any decoder can resolve the file"), (PERMANENT, "no-decoder"))
+        self.assertEqual(classify(1, "read: Input/output error"), (TRANSIENT, "io-error"))
+
+    def test_unknown_and_timeout_are_transient(self):
+        self.assertEqual(classify(1, "something odd"), (TRANSIENT, "unknown"))
+        self.assertEqual(classify(None, ""), (TRANSIENT, "timeout"))
+
+    def test_first_rule_wins(self):
+        self.assertEqual(classify(1, "permission denied: mmkv vault not loaded"), (PERMANENT, "key-missing"))
+
+
+class NegativeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache_path = os.path.join(self.tmp, "failed_cache.json")
+        self.key = os.path.join(self.tmp, "KGMusicV3.db")
+        self.song = self._write("Song.kgm", b"k" * 100)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _cache(self):
+        return NegativeCache(self.cache_path, keys_fingerprint([self.key]))
+
+    def test_keyed_by_content(self):
+        cache = self._cache()
+        cache.add(self.song, "key-missing")
+        cache.save()
+
+        cache = self._cache()
+        copy = self._write("Song (1).kgm", b"k" * 100)
+        self.assertEqual(cache.lookup(copy)["reason"], "key-missing")
+        self.assertIsNone(cache.lookup(self._write("Other.kgm", b"o" * 100)))
+        self.assertIsNone(cache.lookup(self._write("Short.kgm", b"k" * 99)))
+
+    def test_discard(self):
+        cache = self._cache()
+        cache.add(self.song, "unsupported")
+        cache.discard(self.song)
+        self.assertIsNone(cache.lookup(self.song))
+
+    def test_new_key_source_invalidates(self):
+        cache = self._cache()
+        cache.add(self.song, "key-missing")
+        cache.save()
+
+        self._write("KGMusicV3.db", b"db")
+        self.assertIsNone(self._cache().lookup(self.song))
+
+    def test_fingerprint_follows_size_and_mtime(self):
+        before = keys_fingerprint([self.song])
+        os.utime(self.song, ns=(0, 10 ** 9))
+        self.assertNotEqual(keys_fingerprint([self.song]), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
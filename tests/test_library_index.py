@@ -0,0 +1,66 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.archive import run_archive
+from unlock_music.dirsnap import SnapshotCache
+from unlock_music.library_index import LibraryIndex
+from unlock_music.slowfs import SlowFS
+
+# Run: python -m unittest tests/test_library_index.py
+
+LIBRARY_TRACKS = 200
+
+
+class ArchiveSkipOwnedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.src = os.path.join(self.tmp, "src")
+        self.dest = os.path.join(self.tmp, "lib")
+        self.converted = os.path.join(self.dest, "Converted")
+        os.makedirs(os.path.join(self.src, "output"))
+        for i in range(LIBRARY_TRACKS):
+            album = os.path.join(self.converted, f"Album {i // 10}")
+            os.makedirs(album, exist_ok=True)
+            self._write(os.path.join(album, f"Track {i}.m4a"), f"track {i}".encode())
+        index = LibraryIndex(self.dest)
+        index.update(workers=2)
+        index.save()
+        self.snapshots = SnapshotCache(os.path.join(self.tmp, "dirsnap.json"))
+
+    @staticmethod
+    def _write(path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def test_run_does_not_walk_the_library(self):
+        with SlowFS([self.dest], virtual=True) as fs:
+            result = run_archive(self.src, self.dest, skip_owned=True, snapshots=self.snapshots)
+        self.assertEqual(result.moved, 0)
+        # Loading the index and creating the top folders, not a stat per track
+        self.assertLess(fs.calls(), 10, fs.summary())
+
+    def test_identical_copy_is_dropped(self):
+        self._write(os.path.join(self.src, "Track 3.ncm"), b"enc")
+        self._write(os.path.join(self.src, "output", "Track 3.m4a"), b"track 3")
+        result = run_archive(self.src, self.dest, skip_owned=True, snapshots=self.snapshots)
+        self.assertEqual(result.owned, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.src, "output", "Track 3.m4a")))
+
+    def test_stale_index_entry_does_not_delete_the_only_copy(self):
+        os.remove(os.path.join(self.converted, "Album 0", "Track 3.m4a"))
+        self._write(os.path.join(self.src, "Track 3.ncm"), b"enc")
+        self._write(os.path.join(self.src, "output", "Track 3.m4a"), b"track 3")
+
+        result = run_archive(self.src, self.dest, skip_owned=True, snapshots=self.snapshots)
+        self.assertEqual((result.owned, result.moved), (0, 1))
+        self.assertTrue(os.path.exists(os.path.join(self.converted, "Track 3.m4a")))
+        self.assertEqual(LibraryIndex(self.dest).find_name("Track 3"), "Track 3.m4a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.scheduler import (DEFAULT_OVERHEAD, DEFAULT_RATE, CostModel, order_longest_first,
+                                    predict_makespan, run_scheduled)
+
+# Run: python -m unittest tests/test_scheduler.py
+
+MB = 1024 * 1024
+
+
+class CostModelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "cost_model.json")
+
+    def test_defaults_before_anything_is_learned(self):
+        model = CostModel(self.path)
+        self.assertAlmostEqual(model.predict(DEFAULT_RATE, "flac"), DEFAULT_OVERHEAD + 1)
+
+    def test_learns_a_rate_per_format(self):
+        model = CostModel(self.path)
+        for _ in range(30):
+            model.learn(100 * MB, "flac", DEFAULT_OVERHEAD + 10)  # 10 MB/s
+            model.learn(100 * MB, "mp3", DEFAULT_OVERHEAD + 1)    # 100 MB/s
+        self.assertAlmostEqual(model.rate("flac"), 10 * MB, delta=0.1 * MB)
+        self.assertAlmostEqual(model.rate("mp3"), 100 * MB, delta=MB)
+        # Unknown formats are assumed to be as slow as the slowest one seen
+        self.assertEqual(model.rate("dsf"), model.rate("flac"))
+
+    def test_tiny_files_teach_the_overhead(self):
+        model = CostModel(self.path)
+        for _ in range(30):
+            model.learn(1024, "flac", 0.5)
+        self.assertAlmostEqual(model.overhead, 0.5, places=3)
+        self.assertEqual(model.rates, {})
+
+    def test_saved_model_is_used_by_the_next_run(self):
+        model = CostModel(self.path)
+        model.learn(100 * MB, "flac", DEFAULT_OVERHEAD + 10)
+        model.save()
+        self.assertEqual(CostModel(self.path).rates, model.rates)
+
+    def test_unreadable_model_falls_back_to_defaults(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        self.assertEqual(CostModel(self.path).rate("flac"), DEFAULT_RATE)
+
+
+class OrderTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.model = CostModel(os.path.join(tmp, "cost_model.json"))
+        self.model.rates = {"flac": 10 * MB, "mp3": 100 * MB}
+
+    def test_longest_predicted_first(self):
+        items = [("small.flac", MB, "flac"), ("big.mp3", 50 * MB, "mp3"), ("big.flac", 20 * MB, "flac")]
+        # 20 MB of slow FLAC outweighs 50 MB of fast MP3
+        self.assertEqual([it[0] for it in order_longest_first(items, self.model)],
+                         ["big.flac", "big.mp3", "small.flac"])
+
+    def test_makespan(self):
+        # Greedy, like the run itself: 5+3 | 4+3+3 (the optimum 5+4 | 3+3+3 is not searched for)
+        self.assertEqual(predict_makespan([5, 4, 3, 3, 3], 2), 10)
+        self.assertEqual(predict_makespan([5, 4], 8), 5)
+        self.assertEqual(predict_makespan([], 4), 0.0)
+
+    def test_run_starts_the_largest_first_and_stops_on_cancel(self):
+        items = [(f"{n}.flac", n * MB, "flac") for n in range(1, 6)]
+        started = []
+        cancel = threading.Event()
+
+        def work(key):
+            started.append(key)
+            if len(started) == 2:
+                cancel.set()
+            return {"seconds": None}
+
+        done = []
+        run_scheduled(items, work, lambda key, result, exc: done.append(key), self.model,
+                      workers=1, cancel=cancel)
+        self.assertEqual(started, ["5.flac", "4.flac"])
+        self.assertEqual(done, started)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.archive import run_archive
+from unlock_music.clean import run_clean
+from unlock_music.dirsnap import SnapshotCache
+from unlock_music.slowfs import SlowFS
+from unlock_music.unlock import run_unlock
+from unlock_music.verify import crc8, crc16
+
+# Operation counts of unlock -> clean -> archive on a simulated NAS.
+#
+# The whole pipeline runs against a slowed-down folder (virtual time, so no
+# sleeping) with a fake um that writes a small valid FLAC per input. Counts
+# are checked against BASELINE, the numbers measured when this test was
+# written; a change that makes the tools do more round trips on a network
+# share fails here. If a count goes down, lower its baseline.
+#
+# Run: python -m unittest tests/test_slowfs.py
+
+TRACKS = 6
+
+# Measured with TRACKS = 6 (one of them downloaded twice as "(1)"), with
+# every DirEntry.stat() charged as a round trip (Linux NFS/CIFS mounts).
+BASELINE = {
+    "unlock": {"round_trips": 52, "listdir": 1, "stat": 38, "open": 11, "read": 9, "write": 17,
+               "rename": 1, "mkdir": 1},
+    "clean": {"round_trips": 27, "scandir": 2, "stat": 21, "open": 4, "read": 2, "write": 7},
+    "archive": {"round_trips": 69, "scandir": 2, "stat": 38, "open": 12, "read": 5, "write": 15,
+                "rename": 13, "remove": 1, "mkdir": 3},
+}
+
+FAKE_UM = """#!{python}
+import os, sys
+src, out = sys.argv[2], sys.argv[4]
+stem = os.path.splitext(os.path.basename(src))[0]
+with open({flac!r}, "rb") as f:
+    data = f.read()
+with open(os.path.join(out, stem + ".flac"), "wb") as f:
+    f.write(data)
+"""
+
+
+def make_flac(frames=3, block_size=4096):
+    """ Minimal FLAC that passes verify.verify_flac: STREAMINFO + frames with valid CRCs """
+    info = struct.pack(">HH", block_size, block_size) + bytes(6)
+    info += ((44100 << 44) | (15 << 36) | frames * block_size).to_bytes(8, "big") + bytes(16)
+    data = b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info
+    for n in range(frames):
+        header = bytes([0xff, 0xf8, 0x79, 0x08, n]) + struct.pack(">H", block_size - 1)
+        body = header + bytes([crc8(header)]) + b"\x00\x12\x34"
+        data += body + struct.pack(">H", crc16(body))
+    return data
+
+
+@unittest.skipIf(sys.platform == "win32", "the fake um is a script run through its #! line")
+class PipelineOpCountTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.nas = os.path.join(self.tmp, "nas")
+        self.src = os.path.join(self.nas, "src")
+        self.lib = os.path.join(self.nas, "lib")
+        os.makedirs(self.src)
+        for i in range(TRACKS):
+            with open(os.path.join(self.src, f"Artist - Song {i}.ncm"), "wb") as f:
+                f.write(os.urandom(4096 + i))
+        shutil.copyfile(os.path.join(self.src, "Artist - Song 0.ncm"),
+                        os.path.join(self.src, "Artist - Song 0 (1).ncm"))
+
+        flac = os.path.join(self.tmp, "template.flac")
+        with open(flac, "wb") as f:
+            f.write(make_flac())
+        self.um = os.path.join(self.tmp, "um")
+        with open(self.um, "w", encoding="utf-8") as f:
+            f.write(FAKE_UM.format(python=sys.executable, flac=flac))
+        os.chmod(self.um, 0o755)
+        self.snapshots = SnapshotCache(os.path.join(self.tmp, "dirsnap.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _run(self, step, fn):
+        with SlowFS([self.nas], latency=0.005, bandwidth=40e6, virtual=True) as fs:
+            fn()
+        counts = {op: st["calls"] for op, st in fs.summary().items()}
+        counts["round_trips"] = fs.calls()
+        for op, limit in BASELINE[step].items():
+            self.assertLessEqual(counts.get(op, 0), limit, f"{step}: {op} calls {counts}")
+        return counts
+
+    def test_pipeline_op_counts(self):
+        self._run("unlock", lambda: self.assertEqual(
+            run_unlock(self.src, um_path=self.um, workers=2,
+                       cost_model_path=os.path.join(self.tmp, "cost_model.json")).exit_code, 0))
+        self._run("clean", lambda: run_clean(self.src, snapshots=self.snapshots))
+        self._run("archive", lambda: self.assertEqual(
+            run_archive(self.src, self.lib, snapshots=self.snapshots).moved, TRACKS))
+
+        self.assertEqual(len(os.listdir(os.path.join(self.lib, "Converted"))), TRACKS)
+
+
+class DirEntryStatTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        for name in ("a", "b", "c"):
+            with open(os.path.join(self.tmp, name), "wb") as f:
+                f.write(b"x")
+
+    def _sizes(self, **options):
+        with SlowFS([self.tmp], virtual=True, **options) as fs:
+            with os.scandir(self.tmp) as it:
+                for entry in it:
+                    entry.stat()
+                    entry.stat()
+        return fs.calls("scandir"), fs.calls("stat")
+
+    def test_entry_stat_is_a_round_trip(self):
+        self.assertEqual(self._sizes(), (1, 3))
+
+    def test_listing_stats(self):
+        self.assertEqual(self._sizes(listing_stats=True), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
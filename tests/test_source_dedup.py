@@ -0,0 +1,117 @@
+import os
+import sys
+import base64
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.archive import run_archive
+from unlock_music.dirsnap import SnapshotCache
+from unlock_music.source_dedup import (EXACT, NCM_MAGIC, NCM_META_PREFIX, PARTIAL_CHUNK, SAME_SONG,
+                                       DuplicateLog, find_duplicates, ncm_identity, same_content)
+
+# Run: python -m unittest tests/test_source_dedup.py
+
+
+def make_ncm(music_id, body=b"", meta_tail=b"rest of the meta block"):
+    """
+    Enough of an .ncm file for ncm_identity: the first two 'ciphertext'
+    blocks of the meta stand in for the AES blocks of 'music:{"musicId":<id>,'.
+    """
+    blocks = (b"music-id-%012d" % music_id) * 2
+    meta = NCM_META_PREFIX + base64.b64encode(blocks + meta_tail)
+    meta = bytes(b ^ 0x63 for b in meta)
+    key = b"k" * 128
+    return (NCM_MAGIC + b"\x00\x00" + struct.pack("<I", len(key)) + key
+            + struct.pack("<I", len(meta)) + meta + body)
+
+
+class SourceDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.tmp, name), "wb") as f:
+            f.write(data)
+        return name
+
+    def _group(self, *names):
+        return find_duplicates(self.tmp, list(names))
+
+    def test_ncm_identity(self):
+        a = self._write("a.ncm", make_ncm(42, b"mp3" * 100, b"name A"))
+        b = self._write("b.ncm", make_ncm(42, b"flac" * 1000, b"name B"))
+        c = self._write("c.ncm", make_ncm(43))
+        identity = ncm_identity(os.path.join(self.tmp, a))
+        self.assertIsNotNone(identity)
+        self.assertEqual(identity, ncm_identity(os.path.join(self.tmp, b)))
+        self.assertNotEqual(identity, ncm_identity(os.path.join(self.tmp, c)))
+
+    def test_ncm_identity_rejects_other_files(self):
+        self._write("x.ncm", b"ID3" + b"\x00" * 100)
+        self._write("short.ncm", NCM_MAGIC + b"\x00\x00")
+        self.assertIsNone(ncm_identity(os.path.join(self.tmp, "x.ncm")))
+        self.assertIsNone(ncm_identity(os.path.join(self.tmp, "short.ncm")))
+
+    def test_exact_copies_keep_the_plain_name(self):
+        data = os.urandom(4 * PARTIAL_CHUNK)
+        names = [self._write(n, data) for n in ("Song (1).mflac", "Song.mflac", "Song (2).mflac")]
+        self.assertEqual(self._group(*names), {"Song (1).mflac": ("Song.mflac", EXACT),
+                                               "Song (2).mflac": ("Song.mflac", EXACT)})
+
+    def test_same_song_prefers_the_larger_download(self):
+        mp3 = self._write("Song.ncm", make_ncm(7, b"m" * 3000))
+        flac = self._write("Song (1).ncm", make_ncm(7, b"f" * 30000))
+        self.assertEqual(self._group(mp3, flac), {"Song.ncm": ("Song (1).ncm", SAME_SONG)})
+
+    def test_unrelated_files_are_not_grouped(self):
+        same_size = os.urandom(4 * PARTIAL_CHUNK)
+        other = bytearray(same_size)
+        other[PARTIAL_CHUNK + 1] ^= 0xff  # outside the sampled chunks, so the partial hash matches
+        names = [self._write("A.mflac", same_size), self._write("B.mflac", os.urandom(4 * PARTIAL_CHUNK)),
+                 self._write("C.ncm", make_ncm(1)), self._write("D.ncm", make_ncm(2))]
+        self.assertEqual(self._group(*names), {})
+
+        self._write("A (1).mflac", bytes(other))
+        self.assertEqual(self._group("A.mflac", "A (1).mflac"), {"A (1).mflac": ("A.mflac", EXACT)})
+        self.assertFalse(same_content(os.path.join(self.tmp, "A.mflac"), os.path.join(self.tmp, "A (1).mflac")))
+
+
+class ArchiveDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.src = os.path.join(self.tmp, "src")
+        self.dest = os.path.join(self.tmp, "dest")
+        os.makedirs(os.path.join(self.src, "output"))
+
+    def _write(self, *parts, data):
+        with open(os.path.join(self.src, *parts), "wb") as f:
+            f.write(data)
+
+    def test_exact_copy_is_deleted_only_after_a_full_comparison(self):
+        data = os.urandom(4 * PARTIAL_CHUNK)
+        collision = bytearray(data)
+        collision[PARTIAL_CHUNK + 1] ^= 0xff  # same size and partial hash, different content
+        self._write("Song.mflac", data=data)
+        self._write("Song (1).mflac", data=data)
+        self._write("Song (2).mflac", data=bytes(collision))
+        self._write("output", "Song.m4a", data=b"decrypted")
+        dup_log = DuplicateLog(os.path.join(self.src, "output"))
+        dup_log.update(find_duplicates(self.src, ["Song.mflac", "Song (1).mflac", "Song (2).mflac"]))
+        self.assertEqual(dup_log.duplicates_of("Song.mflac"), [("Song (1).mflac", EXACT), ("Song (2).mflac", EXACT)])
+        dup_log.save()
+
+        result = run_archive(self.src, self.dest, snapshots=SnapshotCache(None))
+        self.assertEqual(result.duplicates_removed, 1)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dest, "Originals"))), ["Song (2).mflac", "Song.mflac"])
+        self.assertEqual(os.listdir(os.path.join(self.dest, "Converted")), ["Song.m4a"])
+        self.assertFalse(any(f.endswith(".mflac") for f in os.listdir(self.src)))
+        self.assertEqual(DuplicateLog(os.path.join(self.src, "output")).entries, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
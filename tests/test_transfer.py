@@ -0,0 +1,105 @@
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music import transfer
+
+# Run: python -m unittest tests/test_transfer.py
+
+
+def failing(err):
+    def fn(*args, **kwargs):
+        raise OSError(err, os.strerror(err))
+    return fn
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "exercises the Linux copy primitives")
+class MoveFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.src_dir = os.path.join(self.tmp, "src")
+        self.dst_dir = os.path.join(self.tmp, "dst")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dst_dir)
+        transfer._known_unsupported.clear()
+        transfer._dir_devs.clear()
+        self.addCleanup(transfer._known_unsupported.clear)
+        self.addCleanup(transfer._dir_devs.clear)
+        # Pretend the two folders are on different filesystems, so the copy path runs
+        devs = {self.src_dir: 1, self.dst_dir: 2}
+        patcher = mock.patch.object(transfer, "_dir_dev", lambda p: devs[os.path.dirname(os.path.abspath(p))])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _move(self, name, data=b"audio" * 1000):
+        src = os.path.join(self.src_dir, name)
+        dst = os.path.join(self.dst_dir, name)
+        with open(src, "wb") as f:
+            f.write(data)
+        method = transfer.move_file(src, dst)
+        self.assertFalse(os.path.exists(src))
+        self.assertFalse(os.path.exists(dst + ".part"))
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), data)
+        return method
+
+    def test_rename_on_one_filesystem(self):
+        with mock.patch.object(transfer, "_dir_dev", lambda p: 1):
+            self.assertEqual(self._move("a.flac"), "rename")
+
+    def test_capability_error_is_remembered_for_the_pair(self):
+        reflink = mock.Mock(side_effect=failing(errno.EOPNOTSUPP))
+        with mock.patch.object(transfer, "_reflink", reflink):
+            first = self._move("a.flac")
+            second = self._move("b.flac")
+        self.assertNotEqual(first, "reflink")
+        self.assertEqual(first, second)
+        self.assertEqual(reflink.call_count, 1)
+        self.assertIn(("reflink", 1, 2), transfer._known_unsupported)
+
+    def test_einval_only_counts_for_reflink(self):
+        with mock.patch.object(transfer, "_reflink", failing(errno.EINVAL)), \
+                mock.patch.object(transfer, "_copy_file_range", failing(errno.EINVAL)):
+            self._move("a.flac")
+        self.assertIn(("reflink", 1, 2), transfer._known_unsupported)
+        self.assertNotIn(("copy_file_range", 1, 2), transfer._known_unsupported)
+
+    def test_other_errors_fall_back_for_that_file_only(self):
+        reflink = mock.Mock(side_effect=[OSError(errno.EPERM, "locked"), None])
+        with mock.patch.object(transfer, "_reflink", reflink):
+            first = self._move("a.flac")
+            self.assertEqual(reflink.call_count, 1)
+            self.assertNotEqual(first, "reflink")
+            # Not remembered: the next file tries the fast path again
+            self._move("b.flac")
+        self.assertEqual(reflink.call_count, 2)
+        self.assertEqual(transfer._known_unsupported, set())
+
+    def test_buffered_copy_is_the_last_resort(self):
+        with mock.patch.object(transfer, "_reflink", failing(errno.EXDEV)), \
+                mock.patch.object(transfer, "_copy_file_range", failing(errno.ENOSYS)), \
+                mock.patch.object(transfer, "_sendfile", failing(errno.EIO)):
+            self.assertEqual(self._move("a.flac"), "buffered")
+
+    def test_real_error_is_raised_and_nothing_is_left_behind(self):
+        with mock.patch.object(transfer, "_reflink", failing(errno.EIO)), \
+                mock.patch.object(transfer, "_copy_file_range", failing(errno.EIO)), \
+                mock.patch.object(transfer, "_sendfile", failing(errno.EIO)), \
+                mock.patch.object(transfer.shutil, "copyfileobj", failing(errno.ENOSPC)):
+            src = os.path.join(self.src_dir, "a.flac")
+            with open(src, "wb") as f:
+                f.write(b"audio")
+            with self.assertRaises(OSError):
+                transfer.move_file(src, os.path.join(self.dst_dir, "a.flac"))
+        self.assertTrue(os.path.exists(src))
+        self.assertEqual(os.listdir(self.dst_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
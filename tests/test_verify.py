@@ -0,0 +1,106 @@
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unlock_music.verify import crc8, crc16, ogg_crc, verify_file
+
+# Run: python -m unittest tests/test_verify.py
+
+BLOCK = 4096
+MP3_HEADER = b"\xff\xfb\x90\x00"  # MPEG-1 layer III, 128 kbit/s, 44.1 kHz: 417-byte frames
+MP3_FRAME = 417
+
+ID3V1 = b"TAG" + b"\x00" * 125
+# APEv2 tag with no items and no header: its size field counts just the footer
+APE = b"APETAGEX" + struct.pack("<IIII8x", 2000, 32, 0, 0)
+
+
+def make_flac(frames=3, total=None):
+    """ STREAMINFO + frames with valid CRCs; total overrides the STREAMINFO sample count """
+    total = frames * BLOCK if total is None else total
+    info = struct.pack(">HH", BLOCK, BLOCK) + bytes(6)
+    info += ((44100 << 44) | (15 << 36) | total).to_bytes(8, "big") + bytes(16)
+    data = b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info
+    for n in range(frames):
+        header = bytes([0xff, 0xf8, 0x79, 0x08, n]) + struct.pack(">H", BLOCK - 1)
+        body = header + bytes([crc8(header)]) + b"\x00\x12\x34"
+        data += body + struct.pack(">H", crc16(body))
+    return data
+
+
+def make_mp3(frames=20):
+    return b"".join(MP3_HEADER + bytes(MP3_FRAME - 4) for _ in range(frames))
+
+
+def ogg_page(seq, body, serial=1, eos=False):
+    segments = [255] * (len(body) // 255) + [len(body) % 255]
+    page = bytearray(b"OggS" + bytes([0, 0x4 if eos else 0]) + struct.pack("<qIII", seq, serial, seq, 0)
+                     + bytes([len(segments)]) + bytes(segments) + body)
+    page[22:26] = struct.pack("<I", ogg_crc(bytes(page)))
+    return bytes(page)
+
+
+def make_ogg(pages=4):
+    return b"".join(ogg_page(n, bytes([n]) * 300, eos=n == pages - 1) for n in range(pages))
+
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _check(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return verify_file(path)[1]
+
+    def test_intact_files_pass(self):
+        self.assertIsNone(self._check("a.flac", make_flac()))
+        self.assertIsNone(self._check("a.mp3", make_mp3()))
+        self.assertIsNone(self._check("a.ogg", make_ogg()))
+
+    def test_flac_truncation(self):
+        data = make_flac()
+        self.assertIn("truncated", self._check("cut.flac", data[:-5]))
+        # Whole frames missing: the last frame is intact but ends early
+        self.assertIn("samples present", self._check("short.flac", make_flac(frames=2, total=3 * BLOCK)))
+
+    def test_flac_trailing_tags_pass(self):
+        self.assertIsNone(self._check("v1.flac", make_flac() + ID3V1))
+        self.assertIsNone(self._check("ape.flac", make_flac() + APE))
+        self.assertIsNone(self._check("both.flac", make_flac() + APE + ID3V1))
+        self.assertIn("truncated", self._check("cut_v1.flac", make_flac()[:-5] + ID3V1))
+
+    def test_mp3_truncation(self):
+        data = make_mp3()
+        self.assertIn("incomplete", self._check("cut.mp3", data[:-100]))
+        self.assertIsNone(self._check("v1.mp3", data + ID3V1))
+
+        # A hole in the middle: sync lost far from the end
+        garbled = data[:5 * MP3_FRAME] + bytes(MP3_FRAME) * 10 + data[5 * MP3_FRAME:]
+        self.assertIn("frame sync lost", self._check("hole.mp3", garbled))
+
+    def test_ogg_truncation(self):
+        data = make_ogg()
+        self.assertIn("incomplete", self._check("cut.ogg", data[:-10]))
+        pages = [ogg_page(n, bytes([n]) * 300) for n in range(3)]
+        self.assertIn("end-of-stream", self._check("no_eos.ogg", b"".join(pages)))
+
+        corrupt = bytearray(data)
+        corrupt[-20] ^= 0xff
+        self.assertIn("CRC mismatch", self._check("crc.ogg", bytes(corrupt)))
+        gap = make_ogg()[:len(ogg_page(0, b"\x00" * 300))] + ogg_page(2, b"\x02" * 300, eos=True)
+        self.assertIn("sequence gap", self._check("gap.ogg", gap))
+
+    def test_other_types_are_not_checked(self):
+        self.assertIsNone(self._check("a.m4a", b"anything"))
+        self.assertEqual(self._check("empty.flac", b""), "empty file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Batch unlock, clean-up and archiving of downloaded music.
+
+    from unlock_music import unlock_dir, archive_dir
+    result = await unlock_dir("/srv/downloads", progress=print)
+
+    from unlock_music import run_unlock      # synchronous
+    result = run_unlock("/srv/downloads")
+
+Command line: python -m unlock_music {unlock,clean,archive,verify,index} ...
+Submodules are imported on first use, so importing the package is cheap.
+"""
+
+import os
+
+__version__ = "1.0.0"
+
+# Folder holding the package: default home of cli/um.exe and the run caches
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_EXPORTS = {
+    "unlock_dir": "api",
+    "clean_dir": "api",
+    "archive_dir": "api",
+    "run_unlock": "unlock",
+    "run_clean": "clean",
+    "run_archive": "archive",
+    "UnlockResult": "unlock",
+    "CleanResult": "clean",
+    "ArchiveResult": "archive",
+    "ProgressEvent": "events",
+    "UsageError": "events",
+    "verify_files": "verify",
+    "LibraryIndex": "library_index",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'unlock_music' has no attribute '{name}'")
+    from importlib import import_module
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,28 @@
+import sys
+
+# python -m unlock_music <command> [options]; only the chosen tool is imported.
+
+COMMANDS = {
+    "unlock": ("unlock", "batch-decrypt downloaded music with um"),
+    "clean": ("clean", "deduplicate the output folder and sync the logs"),
+    "archive": ("archive", "move finished files to large storage"),
+    "verify": ("verify", "check decrypted audio for truncation/corruption"),
+    "index": ("library_index", "build or refresh the library index"),
+    "slowfs": ("slowfs", "run a tool against a simulated slow network share"),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print("usage: python -m unlock_music <command> [options]\n\ncommands:")
+        for name, (_, help_text) in COMMANDS.items():
+            print(f"  {name:<8} {help_text}")
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+    from importlib import import_module
+    module = import_module(f"unlock_music.{COMMANDS[argv[0]][0]}")
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
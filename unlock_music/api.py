@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import threading
+
+# asyncio front end for embedding the tools in a long-running service.
+#
+#   result = await unlock_dir("/srv/downloads", workers=4, progress=on_event)
+#
+# Each call runs the synchronous runner on a worker thread (the real work is
+# um subprocesses and file I/O), delivers progress(event) callbacks on the
+# caller's event loop, and turns task cancellation into the runner's cancel
+# flag: no new files are started, running um processes are killed, logs and
+# caches are still written, and then CancelledError is raised as usual.
+# progress may be a plain function or a coroutine function.
+
+
+async def _run(runner, progress, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+
+    def deliver(event):
+        result = progress(event)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+    def report(event):
+        loop.call_soon_threadsafe(deliver, event)
+
+    call = functools.partial(runner, *args, progress=report if progress else None,
+                             cancel=cancel, **kwargs)
+    future = loop.run_in_executor(None, call)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel.set()
+        # Let the runner stop cleanly before propagating
+        await asyncio.wait([future])
+        raise
+
+
+async def unlock_dir(input_dir, *, progress=None, **options):
+    """ Async run_unlock(); options as for unlock_music.unlock.run_unlock. Returns an UnlockResult. """
+    from .unlock import run_unlock
+    return await _run(run_unlock, progress, input_dir, **options)
+
+
+async def clean_dir(target_dir, *, progress=None, **options):
+    """ Async run_clean(). Returns a CleanResult. """
+    from .clean import run_clean
+    return await _run(run_clean, progress, target_dir, **options)
+
+
+async def archive_dir(source_dir, dest_dir, *, progress=None, **options):
+    """ Async run_archive(); move_orphans must not prompt. Returns an ArchiveResult. """
+    from .archive import run_archive
+    return await _run(run_archive, progress, source_dir, dest_dir, **options)
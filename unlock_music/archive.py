@@ -0,0 +1,449 @@
+import os
+import time
+from collections import Counter
+
+from .events import RunResult, UsageError, notify, is_cancelled
+from .profiling import NULL_PROFILER
+from .metrics import NULL_METRICS, file_format
+from .failures import CACHE_NAME as FAILURE_CACHE_NAME, content_hash
+from .transfer import move_file
+from .library_index import normalize
+from .source_dedup import DUPLICATES_NAME, EXACT, DuplicateLog, same_content
+from .dirsnap import default_cache
+
+# Outputs that fail verification are moved here (inside output/), so the next
+# unlock.py run decrypts them again instead of um skipping the existing file
+CORRUPT_DIRNAME = "corrupt"
+
+def load_log(path):
+    s = set()
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    s.add(line.strip())
+        except: pass
+    return s
+
+def append_log(path, new_items):
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            for item in new_items:
+                f.write(item + "\n")
+    except Exception as e:
+        print(f"[!] Error writing log {path}: {e}")
+
+class ArchiveResult(RunResult):
+    tool = "archive"
+
+    def __init__(self):
+        super().__init__()
+        self.moved = 0
+        self.owned = 0
+        self.review = 0
+        self.corrupt = 0
+        self.orphans = 0
+        self.duplicates_removed = 0
+
+
+def run_archive(source_dir, dest_dir, *, covers=False, strip_covers=False, skip_owned=False,
+                check_md5=False, move_orphans=False, snapshots=None, prof=NULL_PROFILER,
+                metrics=NULL_METRICS, progress=None, cancel=None):
+    """
+    Move decrypted files from <source_dir>/output and their originals to dest_dir.
+    covers:       extract cover art into the shared store, folder.jpg per album
+    strip_covers: with covers, also strip the embedded art from archived files
+    skip_owned:   check the library index and skip songs already archived
+    check_md5:    also verify FLAC MD5 signatures (needs 'flac')
+    move_orphans: archive outputs without a matching original; True/False, or a
+                  callable taking the orphan file names and returning a bool
+    snapshots:    a dirsnap.SnapshotCache to share between runs (default: dirsnap.json)
+    Returns an ArchiveResult.
+    """
+    output_dir = os.path.join(source_dir, "output")
+    if not os.path.exists(output_dir):
+        raise UsageError(f"'output' folder not found in {source_dir}")
+    if not dest_dir:
+        raise UsageError("Destination required.")
+    result = ArchiveResult()
+    if snapshots is None:
+        snapshots = default_cache(prof)
+    
+    dest_originals = os.path.join(dest_dir, "Originals")
+    dest_converted = os.path.join(dest_dir, "Converted")
+    
+    # Create dirs
+    for d in [dest_originals, dest_converted]:
+        if not os.path.exists(d):
+            os.makedirs(d)
+            
+    # Optional: shared cover art store
+    cover_store = None
+    if covers:
+        from .covers import CoverStore, prepare_converted
+        cover_store = CoverStore(dest_dir)
+
+    # Optional: skip songs the library already has
+    library = None
+    if skip_owned:
+        from .library_index import LibraryIndex
+        library = LibraryIndex(dest_dir)
+        # Files archived here are added as they are moved; walking the whole
+        # library every run would cost a stat per track on a NAS. Build it
+        # only the first time; library_index.py refreshes it on request.
+        if len(library) == 0:
+            with prof.span("scan", dir=library.root):
+                library.update()
+        else:
+            print(f"[Library] {len(library)} archived tracks loaded "
+                  f"(run library_index.py {dest_dir} after changing the library by hand).")
+
+    def converted_target_dir(src_path):
+        if cover_store is None:
+            return dest_converted
+        with prof.span("covers", file=os.path.basename(src_path)):
+            return prepare_converted(src_path, dest_converted, cover_store, strip_covers)
+
+    def move_converted(src_path, fname):
+        """
+        Move one decrypted file into the library.
+        Returns 'moved', 'owned' (identical file already archived; local copy removed)
+        or 'review' (same title/artist/duration archived; local copy left in output).
+        """
+        match = None
+        if library is not None:
+            with prof.span("dedup", file=fname):
+                match, owned_rel, sha1, meta_key = library.check(src_path)
+                # The library is not walked every run: confirm the archived copy is still
+                # there before deleting ours (one stat per match, not per library track)
+                while match == "exact" and not os.path.exists(os.path.join(library.root, owned_rel)):
+                    library.remove(owned_rel)
+                    owned_rel = library.find_hash(sha1)
+                    if owned_rel is None:
+                        match = None
+            if match == "exact":
+                print(f"[Owned] '{fname}' is identical to '{owned_rel}' in the library. Not copied.")
+                os.remove(src_path)
+                out_snap.removed(fname)
+                result.owned += 1
+                return "owned"
+            if match == "similar":
+                print(f"[Owned?] '{fname}' matches '{owned_rel}' (title/artist/duration). Left in output for review.")
+                result.review += 1
+                return "review"
+        # Covers and album folders only for tracks that are actually archived
+        stripped_before = cover_store.stripped_bytes if cover_store is not None else 0
+        dst_path = os.path.join(converted_target_dir(src_path), fname)
+        if library is not None and cover_store is not None and cover_store.stripped_bytes != stripped_before:
+            # Stripping the cover rewrote the file; index what is actually archived
+            with prof.span("dedup", file=fname):
+                sha1 = content_hash(src_path)
+        # Overwrites an existing file at the destination
+        with prof.span("copy", file=fname):
+            transfer_methods[move_file(src_path, dst_path)] += 1
+        out_snap.removed(fname)
+        if library is not None:
+            library.add(dst_path, sha1, meta_key)
+        return "moved"
+
+    print(f"\nSource: {source_dir}")
+    print(f"Target: {dest_dir}")
+    print("------------------------------------------------")
+
+    # 3. Scan Output for converted files (each folder is listed once, see dirsnap.py)
+    out_snap = snapshots.get(output_dir)
+    src_snap = snapshots.get(source_dir)
+    converted_files = [f for f in out_snap.names()
+                       if not f.endswith('.log') and f not in (FAILURE_CACHE_NAME, DUPLICATES_NAME)]
+    
+    # Scan Source for encrypted files
+    target_exts = ('.ncm', '.qmc0', '.qmc3', '.qmcflac', '.qmcogg', '.mgg', '.mflac', '.bkcmp3', '.bkcflac', '.tm0', '.tm3')
+    # Normalize stems for robust matching (see library_index.normalize)
+    # Map normalized stem -> encrypted filename
+    with prof.span("triage", candidates=len(src_snap.files)):
+        enc_map = dict(src_snap.stem_map(normalize, target_exts))
+    encrypted_files = list(enc_map.values())
+
+    # Copies of an original that unlock.py did not decrypt (see source_dedup.py)
+    dup_log = DuplicateLog(output_dir)
+
+    def archive_duplicates(enc_file, archived_path):
+        """
+        Identical copies are deleted, other versions of the song go to Originals too.
+        A copy is only deleted after a full comparison with the archived original.
+        """
+        for dup, match in dup_log.duplicates_of(enc_file):
+            src_dup_path = os.path.join(source_dir, dup)
+            if src_snap.exists(dup):
+                identical = False
+                if match == EXACT:
+                    with prof.span("dedup", file=dup):
+                        identical = same_content(src_dup_path, archived_path)
+                    if not identical:
+                        print(f"[Dup] {dup} differs from {enc_file} after all; keeping it as another version")
+                if identical:
+                    with prof.span("remove", file=dup):
+                        os.remove(src_dup_path)
+                    result.duplicates_removed += 1
+                    src_snap.removed(dup)
+                    print(f"[Dup] Removed identical copy {dup}")
+                else:
+                    with prof.span("copy", file=dup):
+                        transfer_methods[move_file(src_dup_path, os.path.join(dest_originals, dup))] += 1
+                    src_snap.removed(dup)
+                    print(f"[Dup] Moved other version {dup}")
+                completed_items.append(dup)
+            dup_log.forget(dup)
+
+    transfer_methods = Counter()
+    orphan_files = []
+    completed_items = []
+    
+    # Broken outputs stay in output/ and keep their originals in the source folder
+    from .verify import verify_files
+    print(f"Verifying {len(converted_files)} converted files...")
+    with prof.span("verify", candidates=len(converted_files)):
+        problems = verify_files([os.path.join(output_dir, f) for f in converted_files], check_md5)
+    corrupt = {os.path.basename(p): problem for p, problem in problems.items()}
+    corrupt_dir = os.path.join(output_dir, CORRUPT_DIRNAME)
+    if corrupt:
+        os.makedirs(corrupt_dir, exist_ok=True)
+    for out_file, problem in sorted(corrupt.items()):
+        try:
+            os.replace(os.path.join(output_dir, out_file), os.path.join(corrupt_dir, out_file))
+            out_snap.removed(out_file)
+            print(f"[Corrupt] {out_file}: {problem}. Moved to {CORRUPT_DIRNAME}/, not archived.")
+        except OSError as e:
+            print(f"[Corrupt] {out_file}: {problem}. Not archived; could not move it aside: {e}")
+        metrics.inc("files_failed_total", format=file_format(out_file), action="verify", reason="corrupt")
+        notify(progress, "archive", "verify", out_file, "corrupt")
+    result.corrupt = len(corrupt)
+    result.failed += len(corrupt)  # cannot be archived until re-decrypted
+    converted_files = [f for f in converted_files if f not in corrupt]
+
+    print(f"Found {len(converted_files)} converted files. Matching with {len(encrypted_files)} originals...")
+    metrics.watch_dir("output", output_dir)
+    for out_file in converted_files:
+        metrics.inc("files_queued_total", format=file_format(out_file))
+    
+    # Iterate over OUTPUT files to find their original source
+    for out_file in converted_files:
+        if is_cancelled(cancel):
+            result.cancelled = True
+            break
+        out_stem_norm = normalize(os.path.splitext(out_file)[0])
+        
+        if out_stem_norm in enc_map:
+            # Match Found!
+            enc_file = enc_map[out_stem_norm]
+            # The name may belong to a skipped copy; the output came from its representative
+            rep = dup_log.representative_of(enc_file)
+            if rep and src_snap.exists(rep):
+                enc_file = rep
+            
+            src_enc_path = os.path.join(source_dir, enc_file)
+            src_out_path = os.path.join(output_dir, out_file)
+            
+            dst_enc_path = os.path.join(dest_originals, enc_file)
+            
+            if not src_snap.exists(enc_file):
+                print(f"[Skip] Source file missing: {enc_file}")
+                continue
+
+            fmt = file_format(out_file)
+            metrics.add("files_in_flight", 1)
+            try:
+                enc_bytes = src_snap.size(enc_file)
+                out_bytes = out_snap.size(out_file)
+
+                # Converted first: if the library already has it, it may be left for review
+                outcome = move_converted(src_out_path, out_file)
+                if outcome == "review":
+                    notify(progress, "archive", "move", out_file, "review")
+                    continue
+
+                # Move Original
+                with prof.span("copy", file=enc_file):
+                    transfer_methods[move_file(src_enc_path, dst_enc_path)] += 1
+                src_snap.removed(enc_file)
+                moved_bytes = enc_bytes + (out_bytes if outcome == "moved" else 0)
+                archive_duplicates(enc_file, dst_enc_path)
+                
+                if outcome == "moved":
+                    print(f"[Moved] {out_stem_norm}")
+                completed_items.append(enc_file)
+                result.moved += 1
+                metrics.inc("files_done_total", format=fmt, action="move")
+                metrics.inc("bytes_archived_total", moved_bytes, format=fmt)
+                notify(progress, "archive", "move", out_file, outcome)
+                
+            except Exception as e:
+                print(f"[!] Failed moving {out_stem_norm}: {e}")
+                result.failed += 1
+                metrics.inc("files_failed_total", format=fmt, action="move")
+                notify(progress, "archive", "move", out_file, "failed")
+            finally:
+                metrics.add("files_in_flight", -1)
+                metrics.set("last_progress_timestamp_seconds", time.time())
+        else:
+            orphan_files.append(out_file)
+
+    # --- Orphan Handling ---
+    result.orphans = len(orphan_files)
+    if orphan_files and not result.cancelled:
+        print(f"\n[!] Warning: {len(orphan_files)} converted files had no matching encrypted file in source.")
+        print("This usually means the original file was renamed, deleted, or has a different name structure.")
+        print("Examples of unmatched files:")
+        for out_file in orphan_files[:3]:
+            print(f" - {out_file}")
+        
+        if callable(move_orphans):
+            move_orphans = move_orphans(orphan_files)
+        
+        if move_orphans:
+            print("Moving orphans...")
+            for f in orphan_files:
+                if is_cancelled(cancel):
+                    result.cancelled = True
+                    break
+                src_path = os.path.join(output_dir, f)
+                fmt = file_format(f)
+                metrics.add("files_in_flight", 1)
+                try:
+                    moved_bytes = out_snap.size(f)
+                    outcome = move_converted(src_path, f)
+                    notify(progress, "archive", "move", f, outcome)
+                    if outcome == "review":
+                        continue
+                    if outcome == "owned":
+                        moved_bytes = 0
+                    
+                    # Log them using their own name since original is unknown
+                    completed_items.append(f)
+                    result.moved += 1
+                    metrics.inc("files_done_total", format=fmt, action="move")
+                    metrics.inc("bytes_archived_total", moved_bytes, format=fmt)
+                except Exception as e:
+                    print(f"[!] Failed moving orphan {f}: {e}")
+                    result.failed += 1
+                    metrics.inc("files_failed_total", format=fmt, action="move")
+                    notify(progress, "archive", "move", f, "failed")
+                finally:
+                    metrics.add("files_in_flight", -1)
+                    metrics.set("last_progress_timestamp_seconds", time.time())
+
+    # 4. Update Logs
+    if completed_items:
+        print(f"\nUpdating history logs with {len(completed_items)} items...")
+        
+        # Log 1: Source/output/completed.log
+        so_log = os.path.join(output_dir, "completed.log")
+        with prof.span("log-write", log=so_log):
+            append_log(so_log, completed_items)
+        out_snap.added("completed.log")
+        
+        # Log 2: Dest/completed.log
+        dest_log = os.path.join(dest_dir, "completed.log")
+        with prof.span("log-write", log=dest_log):
+            append_log(dest_log, completed_items)
+        
+    snapshots.save()
+    try:
+        dup_log.save()
+    except OSError as e:
+        print(f"[!] Error writing duplicate log: {e}")
+    if result.duplicates_removed:
+        print(f"\nRemoved {result.duplicates_removed} identical copies of archived originals.")
+
+    if library is not None:
+        try:
+            library.save()
+        except OSError as e:
+            print(f"[!] Error writing library index: {e}")
+        print(f"\nLibrary: {result.owned} already owned (not copied), {result.review} possible duplicates left in output.")
+
+    if cover_store is not None:
+        try:
+            cover_store.save()
+        except OSError as e:
+            print(f"[!] Error writing cover index: {e}")
+        print(f"\nCover store: {cover_store.added} new images, {cover_store.reused} duplicates skipped.")
+        if strip_covers:
+            print(f"Stripped {cover_store.stripped_bytes / 1024 / 1024:.1f} MB of embedded cover art.")
+
+    print("\n=== Archive Complete ===")
+    print(f"Total Moved: {result.moved} pairs/files to {dest_dir}")
+    if corrupt:
+        print(f"Not archived: {len(corrupt)} files failed verification and were moved to "
+              f"output/{CORRUPT_DIRNAME}/. Run unlock.py again to re-decrypt them.")
+    if transfer_methods:
+        print("Transfer methods: " + ", ".join(f"{m}={n}" for m, n in transfer_methods.most_common()))
+    if result.cancelled:
+        print("Cancelled: the remaining files were left in place.")
+    print("Sync logs updated.")
+    return result
+
+
+def add_archive_args(parser):
+    # Flags default to None (not given) so a console run only asks about the others
+    parser.add_argument("source_dir", nargs="?",
+                        help="folder containing the encrypted files and 'output' (asked for when omitted on a console)")
+    parser.add_argument("dest_dir", nargs="?", help="archive destination (local path, NAS or SMB share)")
+    parser.add_argument("--covers", action="store_true", default=None,
+                        help="extract cover art into a shared store and write folder.jpg per album")
+    parser.add_argument("--strip-covers", action="store_true", default=None,
+                        help="with --covers, strip embedded cover art from archived files")
+    parser.add_argument("--skip-owned", action="store_true", default=None,
+                        help="skip songs already in the library (uses/updates library_index.json)")
+    parser.add_argument("--md5", dest="check_md5", action="store_true", default=None,
+                        help="also verify FLAC MD5 signatures (slow, needs the 'flac' tool)")
+    parser.add_argument("--orphans", dest="move_orphans", action="store_true", default=None,
+                        help="also archive outputs with no matching encrypted file")
+
+
+def main(argv=None):
+    from .cli import parse_args, interactive, ask_path, ask_yes, run_tool, cancel_on_signals
+
+    prof, metrics, args = parse_args("archive", argv, add_archive_args,
+                                     "Move decrypted files and their originals to large storage.")
+    prompt = (args.source_dir is None or args.dest_dir is None) and interactive()
+
+    def confirm_orphans(orphan_files):
+        return ask_yes(f"Move these {len(orphan_files)} orphan files to destination anyway?")
+
+    def run():
+        print("=== Music Archive & Sync Tool ===")
+        print("Moves processed files to a larger storage and tracks history.")
+        source_dir, dest_dir = args.source_dir, args.dest_dir
+        given = dict(covers=args.covers, strip_covers=args.strip_covers, skip_owned=args.skip_owned,
+                     check_md5=args.check_md5, move_orphans=args.move_orphans)
+        options = {name: bool(value) for name, value in given.items()}
+        if prompt:
+            if source_dir is None:
+                source_dir = ask_path("\nEnter Source Directory (containing encrypted files & 'output' folder):",
+                                      os.getcwd())
+            if dest_dir is None:
+                dest_dir = ask_path("\nEnter Destination Directory (Large Storage / NAS):\n"
+                                    "Supports local paths (F:\\Music) or SMB/Network paths "
+                                    "(\\\\192.168.1.100\\Public\\Music)")
+            # Only ask about what was not given on the command line or in the config
+            if given["covers"] is None:
+                options["covers"] = ask_yes("\nExtract cover art into a shared store and write folder.jpg per album?")
+            if given["strip_covers"] is None:
+                options["strip_covers"] = options["covers"] and ask_yes(
+                    "Strip embedded cover art from archived files (saves space)?")
+            if given["check_md5"] is None:
+                options["check_md5"] = ask_yes("\nAlso verify FLAC MD5 signatures (slow, needs the 'flac' tool)?")
+            if given["skip_owned"] is None:
+                options["skip_owned"] = ask_yes("Skip songs already in the library (uses/updates library_index.json)?")
+            if given["move_orphans"] is None:
+                options["move_orphans"] = confirm_orphans
+        if not source_dir:
+            raise UsageError("no source directory given")
+        if not dest_dir:
+            raise UsageError("Destination required.")
+        with cancel_on_signals("archive") as cancel:
+            return run_archive(source_dir, dest_dir, prof=prof, metrics=metrics, cancel=cancel,
+                               **options).exit_code
+
+    return run_tool("archive", run, prof, metrics, pause=prompt)
@@ -0,0 +1,283 @@
+import os
+import re
+import time
+
+from .events import RunResult, UsageError, notify, is_cancelled
+from .profiling import NULL_PROFILER
+from .metrics import NULL_METRICS, file_format
+from .failures import CACHE_NAME, parse_failed_line
+from .source_dedup import DUPLICATES_NAME, DuplicateLog
+from .dirsnap import default_cache
+
+
+class CleanResult(RunResult):
+    tool = "clean"
+
+    def __init__(self):
+        super().__init__()
+        self.deleted = 0
+        self.renamed = 0
+        self.temps_removed = 0
+        self.processed = 0
+        self.remaining_failures = 0
+
+
+def _live_size(path):
+    """ Current size of path, None if it is gone """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def run_clean(target_dir, *, snapshots=None, prof=NULL_PROFILER, metrics=NULL_METRICS,
+              progress=None, cancel=None):
+    """
+    Deduplicate <target_dir>/output, remove temporary files and rebuild
+    processed.log / failed.log. Returns a CleanResult.
+    snapshots: a dirsnap.SnapshotCache to share between runs (default: dirsnap.json).
+    """
+    output_dir = os.path.join(target_dir, "output")
+    
+    if not os.path.exists(output_dir):
+        raise UsageError(f"Output directory not found: {output_dir}")
+    result = CleanResult()
+    if snapshots is None:
+        snapshots = default_cache(prof)
+    out_snap = snapshots.get(output_dir)
+
+    print(f"\nScanning Output Directory: {output_dir}")
+    print("SAFE MODE: Source files in parent directory are untouched.")
+    metrics.watch_dir("output", output_dir)
+    
+    # ================================
+    # STEP 1: Aggressive Deduplication
+    # ================================
+    print("\n--- Scanning for Duplicates ---")
+    files = out_snap.names()
+
+    # Copies skipped by unlock.py (see source_dedup.py). A "(N)" representative
+    # (the largest copy of its group) keeps its "(N)" output name.
+    dup_log = DuplicateLog(output_dir)
+    rep_stems = set(os.path.splitext(e["of"])[0] for e in dup_log.entries.values())
+    
+    # Regex for "Name (N).ext" allowing flexible spaces
+    # Group 1: Name, Group 2: Number, Group 3: Extension
+    dup_pattern = re.compile(r"^(.+?)\s*\((\d+)\)(\.[^.]+)$")
+    
+    to_delete = []
+    to_rename = []
+    
+    for fname in files:
+        if fname.lower().endswith('.log'): continue
+        
+        match = dup_pattern.match(fname)
+        if match:
+            base_name = match.group(1)
+            ext = match.group(3)
+            original_fname = base_name + ext
+            
+            if os.path.splitext(fname)[0] in rep_stems:
+                continue
+
+            full_enc_path = os.path.join(output_dir, fname)      # The (1) file
+            full_orig_path = os.path.join(output_dir, original_fname) # The normal file
+            
+            if out_snap.exists(original_fname):
+                # Both exist. Compare size.
+                size_enc = out_snap.size(fname)            # The (N) file
+                size_orig = out_snap.size(original_fname)  # The original
+                if size_enc == size_orig:
+                    print(f"[MATCH] Exact duplicate found: '{fname}'. Queueing for delete.")
+                    to_delete.append((full_enc_path, full_orig_path, size_enc, size_orig))
+                elif size_orig > size_enc:
+                    # Original is bigger. Assuming (N) is the one missing metadata/incomplete.
+                    print(f"[SMART FIX] Original '{original_fname}' is larger ({size_orig} > {size_enc}). Deleting smaller duplicate '{fname}'.")
+                    to_delete.append((full_enc_path, full_orig_path, size_enc, size_orig))
+                else:
+                    # Duplicate (N) is bigger. Original likely damaged or missing metadata.
+                    print(f"[SMART FIX] Duplicate '{fname}' is larger ({size_enc} > {size_orig}). Replacing original.")
+                    to_delete.append((full_orig_path, full_enc_path, size_orig, size_enc)) # Delete small original
+                    to_rename.append((full_enc_path, full_orig_path)) # Rename big duplicate to original
+            else:
+                # Only (N) exists
+                print(f"[ORPHAN] '{fname}' seems to be '{original_fname}'. Queueing rename.")
+                to_rename.append((full_enc_path, full_orig_path))
+
+    # --- Execute Phase ---
+    print(f"\nSummary: {len(to_delete)} files to delete, {len(to_rename)} files to rename/restore.")
+    
+    # Execute Deletes
+    # Sizes came from the snapshot (possibly from an earlier run); stat both
+    # files again so a file that is still being written is never deleted.
+    for path, keep_path, size, keep_size in to_delete:
+        if is_cancelled(cancel):
+            break
+        try:
+            removed = out_snap.exists(os.path.basename(path))
+            if removed and (_live_size(path), _live_size(keep_path)) != (size, keep_size):
+                print(f"[Skip] '{os.path.basename(path)}' or '{os.path.basename(keep_path)}' changed since the scan; not deleting.")
+                removed = False
+            if removed:
+                with prof.span("remove", file=os.path.basename(path)):
+                    os.remove(path)
+                out_snap.removed(os.path.basename(path))
+                print(f"Deleted: {os.path.basename(path)}")
+                result.deleted += 1
+                metrics.inc("files_done_total", format=file_format(path), action="delete")
+                notify(progress, "clean", "dedup", os.path.basename(path), "deleted")
+        except OSError as e:
+            print(f"[Err] Deleting {os.path.basename(path)}: {e}")
+            result.failed += 1
+            metrics.inc("files_failed_total", format=file_format(path), action="delete")
+            
+    # Execute Renames
+    for src, dst in to_rename:
+        if is_cancelled(cancel):
+            break
+        try:
+            # Check if src still exists (it might have been deleted if logic failed, but shouldn't happen here)
+            # Check if dst exists (if we deleted it above, it's gone, so we can rename src to dst)
+            renamed = out_snap.exists(os.path.basename(src)) and not out_snap.exists(os.path.basename(dst))
+            if renamed:
+                with prof.span("rename", file=os.path.basename(src)):
+                    os.rename(src, dst)
+                out_snap.renamed(os.path.basename(src), os.path.basename(dst))
+                print(f"Renamed: {os.path.basename(src)} -> {os.path.basename(dst)}")
+                result.renamed += 1
+                metrics.inc("files_done_total", format=file_format(src), action="rename")
+                notify(progress, "clean", "dedup", os.path.basename(dst), "renamed")
+        except OSError as e:
+            print(f"[Err] Rename failed: {e}")
+            result.failed += 1
+            metrics.inc("files_failed_total", format=file_format(src), action="rename")
+
+    if is_cancelled(cancel):
+        result.cancelled = True
+        snapshots.save()
+        print("\n[!] Cancelled; temporary files and logs were not touched.")
+        return result
+
+    # ================================
+    # STEP 2: Clean Temporary Files
+    # ================================
+    print("\n--- Step 2: Removing Temporary/Incomplete Files ---")
+    # Scan for .tmp, .crdownload (Chrome/Edge), .opdownload (Opera)
+    # or GUID-like files that are common artifacts of crashed browsers
+    temp_exts = ('.tmp', '.crdownload', '.opdownload')
+    
+    deleted_temps = 0
+    for fname in out_snap.names():
+        if fname.lower().endswith(temp_exts):
+            full_path = os.path.join(output_dir, fname)
+            try:
+                with prof.span("remove", file=fname):
+                    os.remove(full_path)
+                out_snap.removed(fname)
+                # print(f"Deleted temp file: {fname}") # Optional verbose
+                deleted_temps += 1
+                metrics.inc("files_done_total", format=file_format(fname), action="delete")
+            except OSError as e:
+                print(f"[Err] Failed to delete temp {fname}: {e}")
+                result.failed += 1
+                metrics.inc("files_failed_total", format=file_format(fname), action="delete")
+                
+    result.temps_removed = deleted_temps
+    notify(progress, "clean", "temp", status="finished", done=deleted_temps)
+    if deleted_temps > 0:
+        print(f"Removed {deleted_temps} temporary/incomplete files.")
+    else:
+        print("No temporary files found.")
+
+    # ================================
+    # STEP 3: Perfect Log Sync
+    # ================================
+    print("\n--- Step 3: Logs Synchronization ---")
+    
+    # Stems in output (the snapshot already reflects the changes above)
+    valid_stems = set(os.path.splitext(f)[0] for f in out_snap.names()
+                      if not f.endswith('.log') and f not in (CACHE_NAME, DUPLICATES_NAME))
+    
+    # Map Source -> Output
+    target_exts = ('.ncm', '.qmc0', '.qmc3', '.qmcflac', '.qmcogg', '.mgg', '.mflac', '.bkcmp3', '.bkcflac', '.tm0', '.tm3')
+    source_listing = snapshots.get(target_dir).names()
+    with prof.span("triage", candidates=len(source_listing)):
+        source_files = [f for f in source_listing if f.lower().endswith(target_exts)]
+    
+    processed_files = []
+    
+    # Copies skipped by unlock.py count as processed once their representative is
+    duplicate_of = {name: e["of"] for name, e in dup_log.entries.items()}
+
+    # We rebuild processed.log to include ANY source file whose stem exists in output
+    for src in source_files:
+        src_stem = os.path.splitext(src)[0]
+        if src in duplicate_of:
+            src_stem = os.path.splitext(duplicate_of[src])[0]
+        if src_stem in valid_stems:
+            processed_files.append(src)
+            
+    # Write processed.log
+    with prof.span("log-write", log="processed.log"):
+        with open(os.path.join(output_dir, "processed.log"), "w", encoding="utf-8") as f:
+            for pf in processed_files:
+                f.write(pf + "\n")
+    out_snap.added("processed.log")
+            
+    result.processed = len(processed_files)
+    print(f"Updated 'processed.log': {len(processed_files)} valid records.")
+            
+    # Clean failed.log
+    failed_path = os.path.join(output_dir, "failed.log")
+    if out_snap.exists("failed.log"):
+        real_failures = []
+        with open(failed_path, "r", encoding="utf-8") as f:
+            for line in f:
+                name, _ = parse_failed_line(line)
+                if not name: continue
+                # if stem is now in valid_stems, it succeeded!
+                if os.path.splitext(name)[0] not in valid_stems:
+                    real_failures.append(line.strip())
+        
+        with prof.span("log-write", log="failed.log"):
+            with open(failed_path, "w", encoding="utf-8") as f:
+                for rf in real_failures:
+                    f.write(rf + "\n")
+        out_snap.added("failed.log")
+        result.remaining_failures = len(real_failures)
+        print(f"Updated 'failed.log': {len(real_failures)} remaining failures.")
+
+    metrics.set("last_progress_timestamp_seconds", time.time())
+    snapshots.save()
+
+    notify(progress, "clean", "logs", status="finished", done=result.processed)
+
+    print("\n=== Done ===")
+    print("Your Output directory should now be clean.")
+    return result
+
+
+def add_clean_args(parser):
+    parser.add_argument("target_dir", nargs="?",
+                        help="source folder containing 'output' (asked for when omitted on a console)")
+
+
+def main(argv=None):
+    from .cli import parse_args, interactive, ask_path, run_tool, cancel_on_signals
+
+    prof, metrics, args = parse_args("clean", argv, add_clean_args,
+                                     "Deduplicate the output folder and sync the history logs.")
+    prompt = args.target_dir is None and interactive()
+
+    def run():
+        print("=== Improved Cleanup & Deduplication Tool ===")
+        print("Goal: Clean 'output' folder and sync logs, ensuring NO duplicates.")
+        target_dir = args.target_dir
+        if prompt:
+            target_dir = ask_path("\nEnter source directory (where encrypted files are):", os.getcwd())
+        if not target_dir:
+            raise UsageError("no source directory given")
+        with cancel_on_signals("clean") as cancel:
+            return run_clean(target_dir, prof=prof, metrics=metrics, cancel=cancel).exit_code
+
+    return run_tool("clean", run, prof, metrics, pause=prompt)
@@ -0,0 +1,194 @@
+import os
+import sys
+import signal
+import argparse
+import threading
+import contextlib
+import configparser
+
+from .events import EXIT_CANCELLED, EXIT_USAGE, UsageError
+from .profiling import add_profile_args, profiler_from_args
+from .metrics import add_metrics_args, metrics_from_args
+
+# Command-line plumbing shared by the unlock / clean / archive entry points.
+#
+# Options can also come from an INI file, given with --config or the
+# UNLOCK_MUSIC_CONFIG environment variable. Keys are the command-line option
+# names without the leading dashes (um, output, md5, skip-owned; dashes or
+# underscores) or the names of the positional arguments (input_dir), read
+# from the tool's section with [DEFAULT] as fallback; the command line
+# always wins:
+#
+#   [DEFAULT]
+#   metrics-file = /var/lib/node_exporter/unlock_music.prom
+#
+#   [unlock]
+#   input_dir = /srv/downloads
+#   workers = 4
+#
+#   [archive]
+#   source_dir = /srv/downloads
+#   dest_dir = /mnt/nas/Music
+#   skip-owned = yes
+
+CONFIG_ENV = "UNLOCK_MUSIC_CONFIG"
+
+_TRUE = {"1", "yes", "true", "on"}
+_FALSE = {"0", "no", "false", "off"}
+
+
+def load_config(path, section):
+    """ {dest: raw string} for one tool from an INI file """
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            parser.read_file(f)
+    except (OSError, configparser.Error) as e:
+        raise UsageError(f"cannot read config {path}: {e}")
+    items = parser.items(section) if parser.has_section(section) else parser.defaults().items()
+    return {key.replace("-", "_"): value for key, value in items}
+
+
+def _config_keys(parser):
+    """ {config key: action}: "--skip-owned" -> skip_owned; dest names (um_path) also work """
+    keys = {}
+    for action in parser._actions:
+        if action.dest in ("help", "config"):
+            continue
+        for option in action.option_strings:
+            if option.startswith("--"):
+                keys[option[2:].replace("-", "_")] = action
+    for action in parser._actions:
+        if action.dest not in ("help", "config"):
+            keys.setdefault(action.dest, action)
+    return keys
+
+
+def _apply_config(parser, values, path):
+    actions = _config_keys(parser)
+    defaults = {}
+    for key, raw in values.items():
+        action = actions.get(key)
+        if action is None:
+            raise UsageError(f"{path}: unknown option '{key}'")
+        dest = action.dest
+        if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+            word = raw.strip().lower()
+            if word not in _TRUE | _FALSE:
+                raise UsageError(f"{path}: '{key}' must be yes or no, not '{raw}'")
+            on = word in _TRUE
+            defaults[dest] = on if isinstance(action, argparse._StoreTrueAction) else not on
+        elif action.type is not None:
+            try:
+                defaults[dest] = action.type(raw)
+            except ValueError:
+                raise UsageError(f"{path}: invalid value for '{key}': '{raw}'")
+        else:
+            defaults[dest] = raw
+    # Positionals with nargs='?' take their default from here as well
+    parser.set_defaults(**defaults)
+
+
+def build_parser(tool, description, configure=None):
+    parser = argparse.ArgumentParser(prog=f"{tool}.py", description=description)
+    if configure:
+        configure(parser)
+    parser.add_argument("--config", metavar="INI",
+                        help=f"read defaults from the [{tool}] section of an INI file (or ${CONFIG_ENV})")
+    add_profile_args(parser)
+    add_metrics_args(parser)
+    return parser
+
+
+def parse_args(tool, argv=None, configure=None, description=None):
+    """
+    Parse the tool's options (added by configure(parser)), --config and the
+    --profile/--metrics options. Returns (profiler, metrics, args).
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser(tool, description, configure)
+    pre, _ = parser.parse_known_args(argv)
+    config_path = pre.config or os.environ.get(CONFIG_ENV)
+    if config_path:
+        try:
+            _apply_config(parser, load_config(config_path, tool), config_path)
+        except UsageError as e:
+            parser.error(str(e))
+    args = parser.parse_args(argv)
+    metrics = metrics_from_args(args, tool)
+    prof = metrics.wrap_profiler(profiler_from_args(args, tool))
+    return prof, metrics, args
+
+
+def interactive():
+    """ Prompts are only shown when a person is at the keyboard """
+    return sys.stdin is not None and sys.stdin.isatty()
+
+
+def ask_path(prompt, default=None):
+    print(prompt)
+    if default:
+        print(f"(Press ENTER to use current: {default})")
+    value = input("> ").strip()
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return value or default
+
+
+def ask_yes(prompt):
+    return input(f"{prompt} (y/N) > ").strip().lower() == 'y'
+
+
+@contextlib.contextmanager
+def cancel_on_signals(tool):
+    """
+    Yields a cancel Event that the first Ctrl+C or SIGTERM sets, so the run
+    stops starting new files and still writes its logs and caches. A second
+    Ctrl+C aborts at once. Wrap only the run itself, so prompts stay
+    interruptible.
+    """
+    cancel = threading.Event()
+    if threading.current_thread() is not threading.main_thread():
+        yield cancel
+        return
+
+    def handler(signum, frame):
+        if cancel.is_set() and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        cancel.set()
+        print(f"\n[!] Stopping {tool} after the files in progress (Ctrl+C again to abort)...")
+
+    saved = {}
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            saved[sig] = signal.signal(sig, handler)
+        except (OSError, ValueError):
+            pass
+    try:
+        yield cancel
+    finally:
+        for sig, previous in saved.items():
+            signal.signal(sig, previous)
+
+
+def run_tool(tool, run, prof, metrics, pause=False):
+    """
+    Call run() and turn the outcome into an exit code. pause keeps the
+    console window open for double-click users.
+    """
+    try:
+        return run()
+    except UsageError as e:
+        print(f"[!] Error: {e}")
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        print(f"\n[!] {tool} interrupted.")
+        return EXIT_CANCELLED
+    finally:
+        prof.finish()
+        metrics.finish()
+        if pause:
+            try:
+                input("Press Enter to exit...")
+            except (EOFError, KeyboardInterrupt):
+                pass
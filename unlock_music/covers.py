@@ -0,0 +1,202 @@
+import os
+import json
+import struct
+import shutil
+import hashlib
+
+from .tags import (to_syncsafe, id3_size, read_flac_blocks, read_id3_frames, read_tags)
+
+# Content-addressed cover art store.
+#
+# Every decrypted track usually carries the same embedded album cover, so a
+# 20-track album stores the same JPEG 20 times. The store keeps each distinct
+# image once under <dest>/Covers/<sha1><ext> and remembers, per album folder
+# path, which image was written as its folder.jpg, so a different cover in a
+# later run replaces it. Lookups are plain dict hits on the in-memory index,
+# which is persisted as Covers/index.json.
+# Album folders are named "<album artist> - <album>" (track artist when there
+# is no album artist), so same-titled albums by different artists stay apart.
+
+COVERS_DIRNAME = "Covers"
+INDEX_NAME = "index.json"
+
+# Characters Windows/SMB refuse in path components
+INVALID_CHARS = '<>:"/\\|?*'
+
+
+def safe_dirname(name):
+    name = "".join("_" if c in INVALID_CHARS or ord(c) < 32 else c for c in name)
+    name = name.strip().rstrip(".")
+    return name[:120]
+
+
+def read_cover_info(path):
+    """
+    Extract the front cover, album name and album artist from a decrypted FLAC or MP3.
+    Returns (image_bytes, ext, album, artist) with None for anything not found.
+    """
+    tags = read_tags(path, want_picture=True)
+    artist = tags.get("album_artist") or tags.get("artist")
+    return tags.get("picture"), tags.get("picture_ext"), tags.get("album"), artist
+
+
+def strip_embedded_cover(path):
+    """
+    Rewrite a FLAC/MP3 without its embedded pictures.
+    Returns the number of bytes saved (0 if nothing was stripped).
+    """
+    try:
+        before = os.path.getsize(path)
+        with open(path, "rb") as f:
+            flac = read_flac_blocks(f)
+            if flac:
+                blocks, audio_offset = flac
+                kept = [(t, p) for t, _, p in blocks if t != 6]
+                if len(kept) == len(blocks):
+                    return 0
+                f.seek(0)
+                header = bytearray(f.read(id3_size(f)))  # keep a leading ID3 tag as-is
+                header += b"fLaC"
+                for i, (btype, payload) in enumerate(kept):
+                    last = 0x80 if i == len(kept) - 1 else 0
+                    header.append(last | btype)
+                    header += len(payload).to_bytes(3, "big")
+                    header += payload
+            else:
+                f.seek(0)
+                id3 = read_id3_frames(f)
+                if not id3:
+                    return 0
+                version, flags, frames, audio_offset = id3
+                kept = [fr for fr in frames if fr[0] != "APIC"]
+                if len(kept) == len(frames):
+                    return 0
+                body = bytearray()
+                for fid, fflags, payload in kept:
+                    size = to_syncsafe(len(payload)) if version == 4 else struct.pack(">I", len(payload))
+                    body += fid.encode("latin-1") + size + fflags + payload
+                # Drop extended header/footer flags since neither is rewritten
+                header = b"ID3" + bytes([version, 0, flags & ~0x50 & 0xff]) + to_syncsafe(len(body)) + bytes(body)
+
+            tmp_path = path + ".covertmp"
+            with open(tmp_path, "wb") as out:
+                out.write(header)
+                f.seek(audio_offset)
+                shutil.copyfileobj(f, out, 1024 * 1024)
+        os.replace(tmp_path, path)
+        return before - os.path.getsize(path)
+    except (OSError, ValueError, struct.error, IndexError) as e:
+        print(f"[!] Could not strip cover from {os.path.basename(path)}: {e}")
+        return 0
+
+
+# ================================
+# Store
+# ================================
+
+class CoverStore:
+    def __init__(self, dest_dir):
+        self.root = os.path.join(dest_dir, COVERS_DIRNAME)
+        self.index_path = os.path.join(self.root, INDEX_NAME)
+        self.covers = {}  # sha1 -> stored filename
+        # album folder relative to dest ("Converted/artist - album") -> sha1 of its
+        # folder art, or "" for folder art that was already there and is left alone
+        self.albums = {}
+        self._written = set()  # album folders whose art was settled in this run
+        self.added = 0
+        self.reused = 0
+        self.stripped_bytes = 0
+        self.dirty = False
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.covers = data.get("covers", {})
+                self.albums = data.get("albums", {})
+            except (OSError, ValueError) as e:
+                print(f"[!] Cover index unreadable, starting fresh: {e}")
+        os.makedirs(self.root, exist_ok=True)
+
+    def add(self, data, ext):
+        """ Store an image once. Returns its content hash. """
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in self.covers:
+            self.reused += 1
+            return digest
+        fname = digest + ext
+        with open(os.path.join(self.root, fname), "wb") as f:
+            f.write(data)
+        self.covers[digest] = fname
+        self.added += 1
+        self.dirty = True
+        return digest
+
+    def path_of(self, digest):
+        return os.path.join(self.root, self.covers[digest])
+
+    def write_folder_art(self, album_dir, digest):
+        """
+        Write folder.jpg (or .png) into an album directory. Rewritten when a
+        later run brings a different cover; within one run the first track's
+        cover wins. Returns True if the file was written.
+        """
+        album_key = os.path.relpath(album_dir, os.path.dirname(self.root)).replace(os.sep, "/")
+        if album_key in self._written:
+            return False
+        self._written.add(album_key)
+        # Indexes from before album folders were keyed by path used the folder name
+        legacy_key = os.path.basename(album_dir)
+        if album_key not in self.albums and legacy_key in self.albums:
+            self.albums[album_key] = self.albums.pop(legacy_key)
+            self.dirty = True
+        current = self.albums.get(album_key)
+        if current == digest or current == "":
+            return False
+        ext = os.path.splitext(self.covers[digest])[1]
+        folder_art = os.path.join(album_dir, "folder" + ext)
+        if current is None and os.path.exists(folder_art):
+            # Not ours (put there by hand or another tool): keep it
+            self.albums[album_key] = ""
+            self.dirty = True
+            return False
+        if current in self.covers and os.path.splitext(self.covers[current])[1] != ext:
+            try:
+                os.remove(os.path.join(album_dir, "folder" + os.path.splitext(self.covers[current])[1]))
+            except OSError:
+                pass
+        shutil.copyfile(self.path_of(digest), folder_art)
+        self.albums[album_key] = digest
+        self.dirty = True
+        return True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"covers": self.covers, "albums": self.albums}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+
+def prepare_converted(src_path, dest_converted, store, strip=False):
+    """
+    Archive-side cover handling for one decrypted file still in output/.
+    Stores its cover, optionally strips it from the file, and returns the
+    directory the file should be moved into (an album folder when the album
+    tag is known, otherwise the flat Converted folder).
+    """
+    image, ext, album, artist = read_cover_info(src_path)
+    target_dir = dest_converted
+    if album:
+        album_dir = safe_dirname(f"{artist} - {album}" if artist else album)
+        if album_dir:
+            target_dir = os.path.join(dest_converted, album_dir)
+            os.makedirs(target_dir, exist_ok=True)
+    if image:
+        digest = store.add(image, ext)
+        if target_dir != dest_converted:
+            store.write_folder_art(target_dir, digest)
+        if strip:
+            store.stripped_bytes += strip_embedded_cover(src_path)
+    return target_dir
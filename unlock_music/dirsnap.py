@@ -0,0 +1,192 @@
+import os
+import json
+import time
+
+from .profiling import NULL_PROFILER
+
+# Directory snapshots for slow (SMB/NFS) folders.
+#
+# On a network mount every listdir/exists/getsize is a round trip. A
+# DirSnapshot lists its folder once (os.scandir; on Windows the sizes and
+# mtimes come back with the listing for free) and answers exists/size/
+# mtime and normalized-stem lookups from memory. The tools report their own
+# creates, renames and deletes to it, so it stays exact for the whole run.
+#
+# Snapshots are persisted in dirsnap.json together with the folder's mtime
+# at listing time. On the next run one stat of the folder decides whether
+# the stored listing is still valid: creating, deleting or renaming a file
+# changes the folder's mtime. Folders this run modified are not persisted
+# (their new mtime cannot be attributed to us alone), nor are folders whose
+# mtime is too close to the listing time to be trusted (coarse SMB/FAT
+# timestamps). Rewriting a file in place does not change its folder's mtime,
+# so callers that care about file contents (library_index --rebuild) still
+# stat or read the files themselves.
+#
+# The cache file lives in the tool folder rather than in the watched folders,
+# since writing it there would itself invalidate them.
+
+SNAPSHOT_NAME = "dirsnap.json"
+SNAPSHOT_VERSION = 1
+
+# Folder mtimes newer than this (seconds) at listing time are not trusted
+RACY_SECONDS = 2.0
+
+# Persisted snapshots not used for this long are dropped
+EXPIRE_SECONDS = 30 * 24 * 3600
+
+
+class DirSnapshot:
+    """ In-memory listing of one folder: files name -> [size, mtime_ns], plus subfolder names """
+
+    def __init__(self, path, files, dirs, mtime_ns, racy=False):
+        self.path = path
+        self.files = files
+        self.dirs = dirs
+        self.mtime_ns = mtime_ns
+        self.racy = racy
+        self.modified = False
+        self._stems = None
+
+    @classmethod
+    def list(cls, path, prof=NULL_PROFILER):
+        with prof.span("scan", dir=path):
+            st = os.stat(path)
+            listed_at = time.time()
+            files = {}
+            dirs = set()
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            dirs.add(entry.name)
+                        elif entry.is_file():
+                            est = entry.stat()
+                            files[entry.name] = [est.st_size, est.st_mtime_ns]
+                    except OSError:
+                        continue
+        racy = listed_at - st.st_mtime < RACY_SECONDS
+        return cls(path, files, dirs, st.st_mtime_ns, racy)
+
+    # --- Queries (no I/O) ---
+
+    def names(self):
+        return sorted(self.files)
+
+    def exists(self, name):
+        return name in self.files
+
+    def size(self, name):
+        return self.files[name][0]
+
+    def stem_map(self, normalize, exts=None):
+        """ {normalize(stem): name} for files (optionally only those ending in exts) """
+        key = (normalize, exts)
+        if self._stems is None or self._stems[0] != key:
+            stems = {}
+            for name in sorted(self.files):
+                if exts is None or name.lower().endswith(exts):
+                    stems[normalize(os.path.splitext(name)[0])] = name
+            self._stems = (key, stems)
+        return self._stems[1]
+
+    # --- Changes made by the tool itself ---
+
+    def added(self, name, size=None, mtime_ns=None):
+        """ Record a file the tool created or overwrote (stats it once if size is not given) """
+        if size is None:
+            st = os.stat(os.path.join(self.path, name))
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        created = name not in self.files
+        self.files[name] = [size, mtime_ns or time.time_ns()]
+        if created:
+            self._changed()
+        # Rewriting an existing file leaves the folder's mtime alone; the snapshot stays valid
+
+    def removed(self, name):
+        self.files.pop(name, None)
+        self._changed()
+
+    def renamed(self, old, new):
+        rec = self.files.pop(old, None)
+        if rec is not None:
+            self.files[new] = rec
+        self._changed()
+
+    def _changed(self):
+        self.modified = True
+        self._stems = None
+
+
+class SnapshotCache:
+    """
+    One DirSnapshot per folder per run, backed by dirsnap.json.
+    Call save() at the end of a run; the same cache object can then be used
+    for the next run (a long-running service), which revalidates each folder.
+    """
+
+    def __init__(self, path, prof=NULL_PROFILER):
+        self.path = path
+        self.prof = prof
+        self.stored = {}  # abs folder -> {"mtime_ns", "files", "dirs", "used"}
+        self.live = {}    # abs folder -> DirSnapshot used in the current run
+        self.listed = 0
+        self.reused = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == SNAPSHOT_VERSION:
+                    self.stored = data.get("dirs", {})
+            except (OSError, ValueError) as e:
+                print(f"[!] Directory snapshot cache unreadable, starting fresh: {e}")
+
+    def get(self, path):
+        """ Snapshot of path for this run: reused if the folder's mtime is unchanged, else listed """
+        key = os.path.abspath(path)
+        snap = self.live.get(key)
+        if snap is not None:
+            return snap
+        rec = self.stored.get(key)
+        if rec is not None:
+            with self.prof.span("stat", dir=path):
+                mtime_ns = os.stat(path).st_mtime_ns
+            if mtime_ns == rec["mtime_ns"]:
+                snap = DirSnapshot(path, {n: list(v) for n, v in rec["files"].items()},
+                                   set(rec["dirs"]), mtime_ns)
+                self.reused += 1
+        if snap is None:
+            snap = DirSnapshot.list(path, self.prof)
+            self.listed += 1
+        self.live[key] = snap
+        return snap
+
+    def forget(self, path):
+        key = os.path.abspath(path)
+        self.live.pop(key, None)
+        self.stored.pop(key, None)
+
+    def save(self):
+        """ Persist this run's trustworthy snapshots and start a new run """
+        now = int(time.time())
+        for key, snap in self.live.items():
+            if snap.modified or snap.racy:
+                self.stored.pop(key, None)
+            else:
+                self.stored[key] = {"mtime_ns": snap.mtime_ns, "files": snap.files,
+                                    "dirs": sorted(snap.dirs), "used": now}
+        self.stored = {k: v for k, v in self.stored.items() if now - v.get("used", 0) < EXPIRE_SECONDS}
+        self.live = {}
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": SNAPSHOT_VERSION, "dirs": self.stored}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[!] Error writing directory snapshot cache: {e}")
+
+
+def default_cache(prof=NULL_PROFILER):
+    from . import TOOL_DIR
+    return SnapshotCache(os.path.join(TOOL_DIR, SNAPSHOT_NAME), prof)
@@ -0,0 +1,52 @@
+from collections import namedtuple
+
+# Progress reporting, results and exit codes shared by the unlock, clean and
+# archive runners.
+#
+# A runner takes an optional progress(event) callable and an optional cancel
+# object with is_set() (a threading.Event). Events are plain tuples so they
+# can be handed across threads or event loops without copying.
+
+EXIT_OK = 0
+EXIT_FAILURES = 1     # ran to the end, but some files failed
+EXIT_USAGE = 2        # bad arguments / config, nothing was done (argparse uses 2 too)
+EXIT_CANCELLED = 130  # interrupted (Ctrl+C, SIGTERM, task cancellation)
+
+# tool:   'unlock' | 'clean' | 'archive'
+# stage:  e.g. 'triage', 'decrypt', 'dedup', 'verify', 'move'
+# name:   file the event is about ('' for stage-level events)
+# status: e.g. 'ok', 'failed', 'skipped', 'owned', 'started', 'finished'
+ProgressEvent = namedtuple("ProgressEvent", "tool stage name status done total")
+
+
+class UsageError(Exception):
+    """ Invalid input (missing folder, um not found, bad config); maps to EXIT_USAGE """
+
+
+class RunResult:
+    """ Counters of one run. Subclasses add the tool-specific ones. """
+
+    tool = ""
+
+    def __init__(self):
+        self.failed = 0
+        self.cancelled = False
+
+    @property
+    def exit_code(self):
+        if self.cancelled:
+            return EXIT_CANCELLED
+        return EXIT_FAILURES if self.failed else EXIT_OK
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in vars(self).items())
+        return f"{type(self).__name__}({fields})"
+
+
+def notify(progress, tool, stage, name="", status="", done=0, total=0):
+    if progress is not None:
+        progress(ProgressEvent(tool, stage, name, status, done, total))
+
+
+def is_cancelled(cancel):
+    return cancel is not None and cancel.is_set()
@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+# Failure classification, retry policy and the negative cache for unlock.py.
+#
+# um reports errors through its logger on stdout and exits non-zero, so the
+# class of a failure is read from the exit status plus the combined output.
+# Permanent failures (unsupported format, no decoder, key missing) go into a
+# negative cache keyed by the file's content hash; the file is not spawned
+# again until its bytes change or the key sources (um.exe itself, the KGG
+# database, the QQMusic mmkv vault) change. Transient failures are retried with bounded
+# exponential backoff and are never cached.
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0   # seconds before the first retry
+BACKOFF_CAP = 30.0
+
+# A file modified this recently may still be downloading
+SETTLE_SECONDS = 5.0
+
+CACHE_NAME = "failed_cache.json"
+
+# Checked in order; first match wins. All matched against lowercased output.
+_RULES = [
+    (PERMANENT, "key-missing", ("ekey missing", "missing kgg database", "decrypt kgg database",
+                                "key not found in mmkv", "doesn't contains media key",
+                                "mmkv vault not loaded", "mmkv key valut not found")),
+    (PERMANENT, "unsupported", ("no suitable decoder", "unsupported crypto version",
+                                "detect file type failed", "magic header not match")),
+    (TRANSIENT, "io-error", ("unexpected eof", "permission denied", "being used by another process",
+                             "sharing violation", "input/output error", "i/o error",
+                             "resource temporarily unavailable", "no such file")),
+    (PERMANENT, "no-decoder", ("no any decoder can resolve",)),
+]
+
+
+def classify(returncode, output):
+    """ Returns (kind, reason) for a failed um run """
+    text = (output or "").lower()
+    for kind, reason, markers in _RULES:
+        if any(m in text for m in markers):
+            return kind, reason
+    if returncode is None:
+        return TRANSIENT, "timeout"
+    return TRANSIENT, "unknown"
+
+
+def backoff_delay(attempt):
+    """ Delay before retry number `attempt` (1-based): 1s, 2s, 4s ... capped """
+    return min(BACKOFF_CAP, BACKOFF_BASE * (2 ** (attempt - 1)))
+
+
+def still_being_written(before, path):
+    """ True if the file changed while um ran, or was modified moments ago """
+    try:
+        after = os.stat(path)
+    except OSError:
+        return False
+    if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+        return True
+    return time.time() - after.st_mtime < SETTLE_SECONDS
+
+
+# zap's colour level encoder writes escape codes into um's stdout
+_ANSI = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+# Start of the note written by format_failed_line
+_NOTE_START = re.compile(rf" \((?:{PERMANENT}|{TRANSIENT}): ")
+
+
+def format_failed_line(name, kind, reason, detail=""):
+    note = f"{kind}: {reason}"
+    if detail:
+        # um's messages quote paths like 'Song (1).ncm'; keep the note free of parentheses
+        detail = _ANSI.sub("", detail).replace("(", "[").replace(")", "]")
+        note += f" - {detail}"
+    return f"{name} ({note})"
+
+
+def parse_failed_line(line):
+    """
+    Split a failed.log line into (name, note). The note starts at the first
+    ' (permanent: ' / ' (transient: ', so names like 'Song (Live).ncm' and
+    details with parentheses survive; other notes are split at the LAST ' ('.
+    """
+    line = line.strip()
+    if not line.endswith(")"):
+        return line, ""
+    m = _NOTE_START.search(line)
+    if m:
+        return line[:m.start()].strip(), line[m.start() + 2:-1]
+    if " (" in line:
+        name, _, note = line.rpartition(" (")
+        return name.strip(), note[:-1]
+    return line, ""
+
+
+def last_error_line(output):
+    """ The most useful single line of um output for a log entry """
+    lines = [l.strip() for l in _ANSI.sub("", output or "").splitlines() if l.strip()]
+    for l in reversed(lines):
+        if "error" in l.lower() or "fatal" in l.lower():
+            return l[-200:]
+    return lines[-1][-200:] if lines else ""
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def um_key_sources(um_path, input_dir):
+    """
+    Files um reads keys from when run as unlock.py runs it (no --kgg-db /
+    --qmc-mmkv), mirroring cli/cmd/um/main.go and cli/algo/qmc/key_mmkv.go:
+    the um binary, the KGG database in %APPDATA%, and the QQMusic mmkv
+    vault next to the input folder or in the macOS QQMusic container.
+    """
+    vaults = [os.path.join(os.path.dirname(os.path.abspath(input_dir)), "mmkv"),
+              os.path.join(os.path.expanduser("~"), "Library", "Containers", "com.tencent.QQMusicMac", "Data",
+                           "Library", "Application Support", "QQMusicMac", "mmkv")]
+    sources = [um_path, os.path.join(os.environ.get("APPDATA", ""), "Kugou8", "KGMusicV3.db")]
+    for vault in vaults:
+        sources.append(os.path.join(vault, "MMKVStreamEncryptId"))
+        sources.append(os.path.join(vault, "MMKVStreamEncryptId.crc"))
+    return sources
+
+
+def keys_fingerprint(paths):
+    """
+    Fingerprint of everything that decides whether a key/decoder is available
+    (see um_key_sources). A change here (new um.exe build, updated KGG
+    database, new mmkv vault) invalidates every cached permanent failure.
+    """
+    h = hashlib.sha1()
+    for p in paths:
+        try:
+            st = os.stat(p)
+            h.update(f"{p}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            h.update(f"{p}|missing\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class NegativeCache:
+    """
+    content hash -> permanent failure record, persisted as JSON.
+    A (name, size, mtime) -> hash map lets unchanged files be looked up with
+    a single stat instead of rehashing their contents every run.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}  # hash -> {"name", "size", "reason", "detail", "time"}
+        self.stat_map = {}  # "name|size|mtime_ns" -> hash
+        self.dirty = False
+        self.sizes = set()  # sizes of cached files; anything else is a miss without hashing
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("fingerprint") == fingerprint:
+                    self.entries = data.get("entries", {})
+                    self.stat_map = data.get("stat_map", {})
+                else:
+                    print("[Info] Decoder/key sources changed; cached failures will be retried.")
+                    self.dirty = True
+            except (OSError, ValueError) as e:
+                print(f"[!] Failure cache unreadable, starting fresh: {e}")
+        self.sizes = {e.get("size") for e in self.entries.values()}
+
+    @staticmethod
+    def _stat_key(name, st):
+        return f"{name}|{st.st_size}|{st.st_mtime_ns}"
+
+    def _hash_for(self, path, st):
+        key = self._stat_key(os.path.basename(path), st)
+        digest = self.stat_map.get(key)
+        if digest is None:
+            digest = content_hash(path)
+        return key, digest
+
+    def lookup(self, path, st=None):
+        """ Returns the cached failure record for this file's content, or None """
+        st = st or os.stat(path)
+        if st.st_size not in self.sizes:
+            return None
+        key, digest = self._hash_for(path, st)
+        entry = self.entries.get(digest)
+        if entry is not None and key not in self.stat_map:
+            # Same bytes under a new name or mtime: remember the cheap key too
+            self.stat_map[key] = digest
+            self.dirty = True
+        return entry
+
+    def add(self, path, reason, detail=""):
+        st = os.stat(path)
+        key, digest = self._hash_for(path, st)
+        self.stat_map[key] = digest
+        self.entries[digest] = {
+            "name": os.path.basename(path),
+            "size": st.st_size,
+            "reason": reason,
+            "detail": detail,
+            "time": int(time.time()),
+        }
+        self.sizes.add(st.st_size)
+        self.dirty = True
+
+    def discard(self, path, st=None):
+        """ Forget a file that has now succeeded """
+        st = st or os.stat(path)
+        if st.st_size not in self.sizes:
+            return
+        key, digest = self._hash_for(path, st)
+        if self.entries.pop(digest, None) is not None:
+            self.stat_map = {k: v for k, v in self.stat_map.items() if v != digest}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": self.entries,
+                       "stat_map": self.stat_map}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def load_failed_log(path):
+    """ name -> full line, in file order """
+    entries = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    name, _ = parse_failed_line(line)
+                    if name:
+                        entries[name] = line.strip()
+        except OSError:
+            pass
+    return entries
+
+
+def write_failed_log(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in entries.values():
+            f.write(line + "\n")
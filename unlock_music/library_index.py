@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from .failures import content_hash
+from .tags import read_tags
+
+# Persistent index of the archived library (<dest>/Converted, recursively).
+#
+# Each track is recorded by content hash and by a normalized
+# "title|artist|duration" key, plus its normalized file stem, so unlock.py
+# can skip songs that are already owned before decrypting them and
+# archive.py can skip them before copying. All lookups are dict hits.
+#
+# The index is stored at <dest>/library_index.json. update() (run by
+# library_index.py, and by archive.py only while the index is empty) walks
+# the library and re-reads only files whose size or mtime changed;
+# archive.py otherwise keeps it current with add() as it moves files, so a
+# run costs no round trips per library track.
+# Hashing runs in a thread pool (hashlib releases the GIL on large
+# buffers, and on a NAS the work is mostly waiting on I/O anyway).
+
+LIBRARY_DIRNAME = "Converted"
+INDEX_NAME = "library_index.json"
+INDEX_VERSION = 1
+
+AUDIO_EXTS = ('.mp3', '.flac', '.ogg', '.m4a', '.aac', '.wav', '.ape', '.wma', '.dff', '.dsf', '.opus')
+
+DEFAULT_WORKERS = 8
+
+
+def normalize(s):
+    """
+    Normalize a stem/tag for matching:
+    1. Lowercase
+    2. Replace _ with space (common in some downloaders)
+    3. Collapse multiple spaces
+    """
+    s = s.lower().replace('_', ' ')
+    return ' '.join(s.split())
+
+
+def make_meta_key(title, artist, duration):
+    if not title or not artist or not duration:
+        return None
+    return f"{normalize(title)}|{normalize(artist)}|{int(round(duration))}"
+
+
+def describe(path):
+    """ (sha1, meta key) for one audio file """
+    tags = read_tags(path)
+    return content_hash(path), make_meta_key(tags.get("title"), tags.get("artist"), tags.get("duration"))
+
+
+class LibraryIndex:
+    def __init__(self, dest_dir):
+        self.root = os.path.join(dest_dir, LIBRARY_DIRNAME)
+        self.index_path = os.path.join(dest_dir, INDEX_NAME)
+        self.files = {}    # relpath -> [size, mtime_ns, sha1, meta_key]
+        # Several files can share a key (copies, same song in two albums): key -> [relpath, ...]
+        self.by_hash = {}  # sha1 -> relpaths
+        self.by_meta = {}  # meta_key -> relpaths
+        self.by_name = {}  # normalized stem -> relpaths
+        self.dirty = False
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    for rel, rec in data.get("files", {}).items():
+                        self._link(rel, rec)
+            except (OSError, ValueError) as e:
+                print(f"[!] Library index unreadable, it will be rebuilt: {e}")
+
+    def __len__(self):
+        return len(self.files)
+
+    def _keys(self, rel, rec):
+        name = normalize(os.path.splitext(os.path.basename(rel))[0])
+        return [(self.by_hash, rec[2]), (self.by_meta, rec[3]), (self.by_name, name)]
+
+    def _link(self, rel, rec):
+        self.files[rel] = rec
+        for table, key in self._keys(rel, rec):
+            if key:
+                table.setdefault(key, []).append(rel)
+
+    def _unlink(self, rel):
+        rec = self.files.pop(rel, None)
+        if rec is None:
+            return
+        for table, key in self._keys(rel, rec):
+            rels = table.get(key)
+            if rels and rel in rels:
+                rels.remove(rel)
+                if not rels:
+                    del table[key]
+
+    # --- Queries (O(1)) ---
+
+    def find_hash(self, sha1):
+        rels = self.by_hash.get(sha1)
+        return rels[0] if rels else None
+
+    def find_meta(self, title, artist, duration):
+        """ Match on title/artist with +-1s duration tolerance """
+        if not title or not artist or not duration:
+            return None
+        for d in (0, -1, 1):
+            rels = self.by_meta.get(make_meta_key(title, artist, duration + d))
+            if rels:
+                return rels[0]
+        return None
+
+    def find_name(self, stem):
+        rels = self.by_name.get(normalize(stem))
+        return rels[0] if rels else None
+
+    def check(self, path):
+        """
+        Look a candidate file up before archiving it.
+        Returns (match, relpath, sha1, meta_key); match is 'exact', 'similar' or None.
+        """
+        tags = read_tags(path)
+        sha1 = content_hash(path)
+        meta_key = make_meta_key(tags.get("title"), tags.get("artist"), tags.get("duration"))
+        rel = self.find_hash(sha1)
+        if rel:
+            return "exact", rel, sha1, meta_key
+        rel = self.find_meta(tags.get("title"), tags.get("artist"), tags.get("duration"))
+        if rel:
+            return "similar", rel, sha1, meta_key
+        return None, None, sha1, meta_key
+
+    # --- Maintenance ---
+
+    def add(self, path, sha1, meta_key, st=None):
+        """ Record a file that was just placed in the library (already hashed) """
+        st = st or os.stat(path)
+        rel = os.path.relpath(path, self.root)
+        self._unlink(rel)
+        self._link(rel, [st.st_size, st.st_mtime_ns, sha1, meta_key])
+        self.dirty = True
+
+    def remove(self, rel):
+        """ Forget a track that is no longer in the library """
+        if rel in self.files:
+            self._unlink(rel)
+            self.dirty = True
+
+    def _scan(self):
+        found = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.lower().endswith(AUDIO_EXTS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.root)] = (st.st_size, st.st_mtime_ns)
+        return found
+
+    def update(self, workers=DEFAULT_WORKERS, rebuild=False):
+        """
+        Bring the index in line with the library. Returns (added, removed).
+        rebuild=True re-reads every file.
+        """
+        if not os.path.isdir(self.root):
+            return 0, 0
+        start = time.time()
+        found = self._scan()
+
+        removed = [rel for rel in self.files if rel not in found]
+        for rel in removed:
+            self._unlink(rel)
+
+        todo = []
+        for rel, (size, mtime_ns) in found.items():
+            rec = self.files.get(rel)
+            if rebuild or rec is None or rec[0] != size or rec[1] != mtime_ns:
+                todo.append(rel)
+
+        if todo:
+            print(f"[Library] Indexing {len(todo)} new/changed tracks with {workers} workers...")
+
+        def work(rel):
+            try:
+                return rel, describe(os.path.join(self.root, rel))
+            except OSError as e:
+                print(f"[!] Could not index {rel}: {e}")
+                return rel, None
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for rel, result in pool.map(work, todo):
+                done += 1
+                if result is not None:
+                    size, mtime_ns = found[rel]
+                    self._unlink(rel)
+                    self._link(rel, [size, mtime_ns, result[0], result[1]])
+                if done % 1000 == 0:
+                    print(f"[Library] {done}/{len(todo)} indexed...")
+
+        if todo or removed:
+            self.dirty = True
+        print(f"[Library] {len(self.files)} tracks indexed "
+              f"({len(todo)} updated, {len(removed)} removed, {time.time() - start:.1f}s).")
+        return len(todo), len(removed)
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="library_index.py",
+                                     description="Build or refresh the library index used to skip already-owned songs.")
+    parser.add_argument("dest_dir", help="archive destination (the folder containing 'Converted')")
+    parser.add_argument("--rebuild", action="store_true", help="re-read every file instead of only changed ones")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"parallel readers (default: {DEFAULT_WORKERS})")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    index = LibraryIndex(args.dest_dir)
+    index.update(workers=args.workers, rebuild=args.rebuild)
+    index.save()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
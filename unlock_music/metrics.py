@@ -0,0 +1,336 @@
+import os
+import time
+import bisect
+import shutil
+import threading
+
+# Prometheus-style metrics for unlock.py / clean.py / archive.py.
+#
+# Writers never take a lock: every thread increments its own shard (plain
+# dicts), and the exporter sums the shards when it renders. Rendering copies
+# each shard dict first, which CPython does atomically, so a scrape never
+# blocks a decrypt. Metrics are exposed either as a text file (for the
+# node_exporter textfile collector) rewritten every few seconds, or on a
+# local HTTP endpoint at /metrics.
+
+PREFIX = "unlock_music_"
+
+# Seconds; covers a fast stat call up to a multi-minute DSD decrypt
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+METRIC_HELP = {
+    "files_queued_total": ("counter", "Files queued for processing"),
+    "files_in_flight": ("gauge", "Files currently being processed"),
+    "files_done_total": ("counter", "Files processed successfully"),
+    "files_failed_total": ("counter", "Files that failed processing"),
+    "files_skipped_total": ("counter", "Files skipped without decrypting, by reason: duplicate, owned, "
+                                        "or a cached permanent failure (key-missing, unsupported, no-decoder)"),
+    "retries_total": ("counter", "Retries of transient failures"),
+    "bytes_decrypted_total": ("counter", "Encrypted input bytes successfully decrypted"),
+    "bytes_archived_total": ("counter", "Bytes moved to the archive destination"),
+    "stage_seconds": ("histogram", "Per-stage latency"),
+    "last_progress_timestamp_seconds": ("gauge", "Unix time of the last finished or failed file"),
+    "staging_bytes": ("gauge", "Bytes currently held in a staging directory"),
+    "staging_free_bytes": ("gauge", "Free bytes on the filesystem of a staging directory"),
+    "run_start_timestamp_seconds": ("gauge", "Unix time the tool started"),
+}
+
+# Every series of a metric carries the same labels (Prometheus treats a
+# different label set as a different series, which breaks sum by (...)).
+# Labels a call does not pass are exported as "".
+METRIC_LABELS = {
+    "files_queued_total": ("format",),
+    "files_done_total": ("format", "action"),
+    "files_failed_total": ("format", "action", "kind", "reason"),
+    "files_skipped_total": ("format", "reason"),
+    "retries_total": ("format", "reason"),
+    "bytes_decrypted_total": ("format",),
+    "bytes_archived_total": ("format",),
+    "stage_seconds": ("stage",),
+}
+
+
+def _series(name, labels):
+    """ (name, label items) with the metric's fixed label set """
+    names = METRIC_LABELS.get(name)
+    if names is None:
+        return name, tuple(sorted(labels.items()))
+    unknown = set(labels) - set(names)
+    if unknown:
+        raise ValueError(f"{name} has no label {', '.join(sorted(unknown))}")
+    return name, tuple(sorted((label, labels.get(label, "")) for label in names))
+
+
+def file_format(fname):
+    """ Label value for a file's format, e.g. 'ncm' or 'mflac' """
+    return os.path.splitext(fname)[1].lstrip(".").lower() or "none"
+
+
+class NullMetrics:
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def add(self, name, value, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def watch_dir(self, role, path):
+        pass
+
+    def wrap_profiler(self, prof):
+        return prof
+
+    def finish(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self, tool):
+        self.tool = tool
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # only taken when a new thread first writes
+        self._gauges = {}    # absolute gauges, last write wins
+        self._watched = {}   # role -> directory
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        self.file_path = None
+        self.set("run_start_timestamp_seconds", time.time())
+
+    # --- Hot path ---
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = ({}, {})  # (sums, histograms)
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        """ Increase a counter """
+        sums = self._shard()[0]
+        key = _series(name, labels)
+        sums[key] = sums.get(key, 0) + value
+
+    # Gauges that go up and down (in-flight) are summed across shards too
+    add = inc
+
+    def set(self, name, value, **labels):
+        """ Set an absolute gauge """
+        self._gauges[_series(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        hists = self._shard()[1]
+        key = _series(name, labels)
+        h = hists.get(key)
+        if h is None:
+            h = hists[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        h[0][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        h[1] += value
+        h[2] += 1
+
+    def watch_dir(self, role, path):
+        """ Report size and free space of a staging directory at render time """
+        self._watched[role] = path
+
+    def wrap_profiler(self, prof):
+        """ Feed every profiler span into the stage latency histogram """
+        return _MetricsProfiler(self, prof)
+
+    # --- Rendering ---
+
+    def _dir_gauges(self):
+        values = {}
+        for role, path in list(self._watched.items()):
+            total = 0
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                values[("staging_bytes", (("dir", role),))] = total
+                values[("staging_free_bytes", (("dir", role),))] = shutil.disk_usage(path).free
+            except OSError:
+                pass
+        return values
+
+    def snapshot(self):
+        sums = {}
+        hists = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard_sums, shard_hists in shards:
+            for key, value in dict(shard_sums).items():
+                sums[key] = sums.get(key, 0) + value
+            for key, (buckets, total, count) in dict(shard_hists).items():
+                agg = hists.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                for i, n in enumerate(list(buckets)):
+                    agg[0][i] += n
+                agg[1] += total
+                agg[2] += count
+        gauges = dict(self._gauges)
+        gauges.update(self._dir_gauges())
+        return sums, gauges, hists
+
+    def render(self):
+        sums, gauges, hists = self.snapshot()
+        by_name = {}
+        for (name, labels), value in list(sums.items()) + list(gauges.items()):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(set(by_name) | {k[0] for k in hists}):
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            full = PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in sorted(by_name.get(name, [])):
+                lines.append(f"{full}{_labels(self.tool, labels)} {_num(value)}")
+            for (hname, labels), (buckets, total, count) in sorted(hists.items()):
+                if hname != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += n
+                    le = labels + (("le", bound if bound == "+Inf" else _num(bound)),)
+                    lines.append(f"{full}_bucket{_labels(self.tool, le)} {cumulative}")
+                lines.append(f"{full}_sum{_labels(self.tool, labels)} {_num(total)}")
+                lines.append(f"{full}_count{_labels(self.tool, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    # --- Exporters ---
+
+    def start_file_exporter(self, path, interval=5.0):
+        self.file_path = path
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.write_file(path)
+
+        t = threading.Thread(target=loop, name="metrics-file", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def write_file(self, path):
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[!] Error writing metrics {path}: {e}")
+
+    def start_http_exporter(self, port, host="127.0.0.1"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # keep the console for the tool's own output
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        t = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        t.start()
+        self._threads.append(t)
+        print(f"[Metrics] Serving http://{host}:{self._server.server_address[1]}/metrics")
+
+    def finish(self):
+        self._stop.set()
+        if self.file_path:
+            self.write_file(self.file_path)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _num(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _labels(tool, labels):
+    pairs = [("tool", tool)] + list(labels)
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + inner + "}"
+
+
+class _MetricsSpan:
+    __slots__ = ("metrics", "inner", "name", "start")
+
+    def __init__(self, metrics, inner, name):
+        self.metrics = metrics
+        self.inner = inner
+        self.name = name
+
+    def __enter__(self):
+        self.inner.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe("stage_seconds", time.perf_counter() - self.start, stage=self.name)
+        return self.inner.__exit__(*exc)
+
+
+class _MetricsProfiler:
+    """ Profiler wrapper: keeps the inner profiler's spans and adds latency histograms """
+
+    def __init__(self, metrics, inner):
+        self.metrics = metrics
+        self.inner = inner
+        self.enabled = inner.enabled
+
+    def span(self, name, **args):
+        return _MetricsSpan(self.metrics, self.inner.span(name, **args), name)
+
+    def finish(self):
+        self.inner.finish()
+
+
+def add_metrics_args(parser):
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="write Prometheus text-format metrics to PATH every few seconds")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, metavar="SECONDS",
+                        help="how often --metrics-file is rewritten (default: 5)")
+
+
+def metrics_from_args(args, tool):
+    if not args.metrics_file and args.metrics_port is None:
+        return NULL_METRICS
+    metrics = Metrics(tool)
+    if args.metrics_file:
+        metrics.start_file_exporter(os.path.abspath(args.metrics_file), args.metrics_interval)
+    if args.metrics_port is not None:
+        metrics.start_http_exporter(args.metrics_port)
+    return metrics
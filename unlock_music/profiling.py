@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import threading
+
+# Lightweight span recorder for unlock.py / clean.py / archive.py.
+#
+# Spans are written as Chrome trace-event JSON ("X" complete events), which
+# opens directly in https://ui.perfetto.dev or chrome://tracing.
+# When --profile is not given every tool gets NULL_PROFILER, whose span()
+# hands back one shared no-op context manager, so the hot loops pay only a
+# method call.
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullProfiler:
+    enabled = False
+
+    def span(self, name, **args):
+        return _NULL_SPAN
+
+    def finish(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Span:
+    __slots__ = ("prof", "name", "args", "start")
+
+    def __init__(self, prof, name, args):
+        self.prof = prof
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.prof.record(self.name, self.start, end, self.args)
+        return False
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, tool, trace_path, cprofile_path=None):
+        self.tool = tool
+        self.trace_path = trace_path
+        self.cprofile_path = cprofile_path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.lock = threading.Lock()
+        self.cprof = None
+        if cprofile_path:
+            import cProfile
+            self.cprof = cProfile.Profile()
+            self.cprof.enable()
+
+    def span(self, name, **args):
+        """ Context manager timing one phase, e.g. prof.span("decrypt", file=fname) """
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start_ns - self.origin) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def finish(self):
+        if self.cprof is not None:
+            self.cprof.disable()
+            try:
+                self.cprof.dump_stats(self.cprofile_path)
+                print(f"[Profile] cProfile stats written to {self.cprofile_path}")
+            except OSError as e:
+                print(f"[!] Error writing cProfile stats: {e}")
+            self.cprof = None
+
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.tool}}]
+        try:
+            with open(self.trace_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": meta + self.events, "displayTimeUnit": "ms"}, f)
+            print(f"[Profile] {len(self.events)} spans written to {self.trace_path}")
+        except OSError as e:
+            print(f"[!] Error writing trace {self.trace_path}: {e}")
+
+
+def add_profile_args(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help="record per-phase spans as Chrome trace-event JSON (viewable in Perfetto)")
+    parser.add_argument("--profile-out", metavar="TRACE_JSON",
+                        help="where --profile writes the trace (implies --profile; "
+                             "default: <tool>-<time>.trace.json)")
+    parser.add_argument("--profile-python", action="store_true",
+                        help="with --profile, also dump cProfile stats (.prof) of the Python side")
+
+
+def profiler_from_args(args, tool):
+    if not args.profile and not args.profile_out:
+        return NULL_PROFILER
+    trace_path = args.profile_out or f"{tool}-{time.strftime('%Y%m%d-%H%M%S')}.trace.json"
+    cprofile_path = None
+    if args.profile_python:
+        cprofile_path = os.path.splitext(trace_path)[0]
+        if cprofile_path.endswith(".trace"):
+            cprofile_path = cprofile_path[:-len(".trace")]
+        cprofile_path += ".prof"
+    return Profiler(tool, os.path.abspath(trace_path), cprofile_path)
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Size-aware scheduling for unlock.py.
+#
+# Work is ordered longest-first (LPT) so a 2 GB DSD file starts early instead
+# of leaving every other worker idle at the end of a run. The expected cost of
+# a file is  overhead + size / rate[format], where the per-format rate
+# (bytes/second) and the fixed per-file overhead (process spawn, metadata)
+# are learned from previous runs as exponential moving averages and kept in
+# cost_model.json.
+#
+# The number of concurrent um processes is tuned while running by hill
+# climbing on measured throughput: add a worker while throughput improves
+# and the CPUs are not saturated, back off once it stops improving (disk or
+# NAS saturated).
+
+COST_MODEL_NAME = "cost_model.json"
+
+DEFAULT_RATE = 40 * 1024 * 1024   # bytes/second before anything was learned
+DEFAULT_OVERHEAD = 0.1            # seconds per file
+EWMA_ALPHA = 0.3
+
+# Throughput must change by more than this to count as better/worse
+TUNE_TOLERANCE = 0.05
+# Minimum length of a measurement window (seconds)
+TUNE_WINDOW = 2.0
+CPU_SATURATED = 0.9
+
+
+class CostModel:
+    def __init__(self, path):
+        self.path = path
+        self.rates = {}   # format -> bytes/second
+        self.overhead = DEFAULT_OVERHEAD
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.rates = data.get("rates", {})
+                self.overhead = data.get("overhead", DEFAULT_OVERHEAD)
+            except (OSError, ValueError) as e:
+                print(f"[!] Cost model unreadable, using defaults: {e}")
+
+    def rate(self, fmt):
+        if fmt in self.rates:
+            return self.rates[fmt]
+        if self.rates:
+            # Unknown format: assume the slowest one seen so far
+            return min(self.rates.values())
+        return DEFAULT_RATE
+
+    def predict(self, size, fmt):
+        """ Expected seconds for one file """
+        return self.overhead + size / self.rate(fmt)
+
+    def learn(self, size, fmt, seconds):
+        if seconds <= 0:
+            return
+        if size < 64 * 1024:
+            # Tiny files are all overhead
+            self.overhead += EWMA_ALPHA * (seconds - self.overhead)
+        else:
+            sample = size / max(seconds - self.overhead, seconds * 0.1)
+            old = self.rates.get(fmt)
+            self.rates[fmt] = sample if old is None else old + EWMA_ALPHA * (sample - old)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"rates": self.rates, "overhead": self.overhead}, f, indent=1)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def order_longest_first(items, model):
+    """ items: list of (key, size, fmt). Returns [(key, size, fmt, predicted_seconds)] sorted LPT. """
+    costed = [(key, size, fmt, model.predict(size, fmt)) for key, size, fmt in items]
+    costed.sort(key=lambda it: it[3], reverse=True)
+    return costed
+
+
+def predict_makespan(costs, workers):
+    """ Greedy LPT simulation: seconds until the last worker finishes """
+    loads = [0.0] * max(1, workers)
+    for c in sorted(costs, reverse=True):
+        i = loads.index(min(loads))
+        loads[i] += c
+    return max(loads) if costs else 0.0
+
+
+class _CpuMeter:
+    """ Share of all CPUs used by finished child processes since the last sample """
+
+    def __init__(self):
+        self.cpus = os.cpu_count() or 1
+        self.last = self._sample()
+
+    @staticmethod
+    def _sample():
+        t = os.times()
+        return time.monotonic(), t.children_user + t.children_system
+
+    def utilization(self):
+        now, cpu = self._sample()
+        wall = now - self.last[0]
+        used = cpu - self.last[1]
+        self.last = (now, cpu)
+        if wall <= 0 or used <= 0:
+            return None  # not measurable (e.g. Windows reports no child times)
+        return used / (wall * self.cpus)
+
+
+class WorkerTuner:
+    """ Hill climbing on throughput (bytes/second) to pick the worker count """
+
+    def __init__(self, initial, max_workers, fixed=False):
+        self.target = max(1, min(initial, max_workers))
+        self.max_workers = max_workers
+        self.fixed = fixed
+        self.direction = 1
+        self.best = None
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.cpu = _CpuMeter()
+        self.history = []  # (workers, bytes/sec)
+
+    def record(self, nbytes):
+        self.window_bytes += nbytes
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if self.fixed or elapsed < TUNE_WINDOW:
+            return
+        rate = self.window_bytes / elapsed
+        util = self.cpu.utilization()
+        self.history.append((self.target, rate))
+        self.window_start = now
+        self.window_bytes = 0
+
+        if self.best is not None and rate < self.best * (1 - TUNE_TOLERANCE):
+            # Got worse: turn around
+            self.direction = -self.direction
+        elif self.best is not None and rate <= self.best * (1 + TUNE_TOLERANCE):
+            # No real gain: hold, prefer fewer workers
+            self.direction = -1
+        if util is not None and util >= CPU_SATURATED and self.direction > 0:
+            self.direction = -1
+        # Reference decays toward recent windows so one lucky window does not pin it
+        self.best = rate if self.best is None else max(rate * 0.5 + self.best * 0.5, rate)
+        self.target = max(1, min(self.max_workers, self.target + self.direction))
+
+
+def run_scheduled(items, work, on_done, model, workers=None, max_workers=None, cancel=None):
+    """
+    Run work(key) for every (key, size, fmt) in items, longest predicted first.
+    on_done(key, result, exc) is called on the calling thread as results arrive.
+    work() must return the number of seconds spent on the real decrypt (or None
+    if it should not be learned from) as result["seconds"].
+    workers: fixed worker count; None tunes it automatically.
+    cancel: optional threading.Event; once set no new work is started.
+    Returns a dict with predicted and actual durations.
+    """
+    cpus = os.cpu_count() or 1
+    max_workers = max_workers or max(2, cpus * 2)
+    initial = workers or max(1, min(cpus, len(items)))
+    tuner = WorkerTuner(initial, workers or max_workers, fixed=workers is not None)
+
+    ordered = order_longest_first(items, model)
+    predicted = predict_makespan([c for *_, c in ordered], tuner.target)
+    start = time.monotonic()
+    pending = list(reversed(ordered))  # pop() from the end = largest first
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=tuner.max_workers) as pool:
+        while pending or running:
+            if cancel is not None and cancel.is_set():
+                pending.clear()
+            while pending and len(running) < tuner.target:
+                key, size, fmt, _ = pending.pop()
+                running[pool.submit(work, key)] = (key, size, fmt)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                key, size, fmt = running.pop(fut)
+                try:
+                    result = fut.result()
+                    exc = None
+                except Exception as e:
+                    result, exc = None, e
+                if result and result.get("seconds"):
+                    model.learn(size, fmt, result["seconds"])
+                tuner.record(size)
+                on_done(key, result, exc)
+
+    return {
+        "predicted": predicted,
+        "actual": time.monotonic() - start,
+        "workers": tuner.target,
+        "history": tuner.history,
+    }
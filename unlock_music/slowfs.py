@@ -0,0 +1,453 @@
+import os
+import sys
+import json
+import time
+import errno
+import random
+import builtins
+import argparse
+import threading
+
+# Slow-filesystem simulator for load testing the tools against NAS conditions.
+#
+# SlowFS patches the os / builtins calls the tools use so that, for paths
+# under the given roots, every call pays a per-operation latency, reads and
+# writes share one bandwidth-capped link, and any operation can fail with an
+# injected EIO at a given rate. It counts every call, so benchmarks and
+# regression checks can assert on metadata round trips:
+#
+#   with SlowFS(["/tmp/nas"], latency=0.002, bandwidth=40e6, virtual=True) as fs:
+#       run_archive("/tmp/nas/src", "/tmp/nas/lib")
+#   fs.report()
+#   assert fs.calls("stat") <= 3
+#
+# virtual=True does not sleep: the simulated time is added up in fs.elapsed
+# instead, so large runs stay fast while the totals stay comparable.
+#
+# os.path.exists/getsize/isdir are stat calls. By default DirEntry.stat() is
+# one too, as on Linux NFS/CIFS mounts where a listing carries names and
+# types only; listing_stats=True models Windows SMB, where scandir returns
+# the sizes with the listing (one round trip for the folder). Only this
+# process is patched; verify.py's worker processes read files unthrottled
+# (with the fork start method they inherit the latency but their counts are
+# lost).
+#
+#   python -m unlock_music slowfs --latency 2 --bandwidth 40 --slow /tmp/nas -- archive /tmp/nas/src /tmp/nas/lib
+
+# Operation names, in report order
+OPS = ("listdir", "scandir", "stat", "open", "read", "write", "copy",
+       "rename", "remove", "mkdir", "setattr")
+# Operations that are one metadata round trip each
+META_OPS = ("listdir", "scandir", "stat", "open", "rename", "remove", "mkdir", "setattr")
+
+# os function -> operation it counts as
+_OS_CALLS = {
+    "listdir": "listdir",
+    "scandir": "scandir",
+    "stat": "stat",
+    "lstat": "stat",
+    "rename": "rename",
+    "replace": "rename",
+    "remove": "remove",
+    "unlink": "remove",
+    "rmdir": "remove",
+    "mkdir": "mkdir",
+    "utime": "setattr",
+    "chmod": "setattr",
+}
+
+
+class _OpStats:
+    __slots__ = ("calls", "bytes", "seconds", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = 0
+
+
+class _SlowFile:
+    """
+    File object proxy charging reads and writes to the link. Every call
+    (read, readline, readlines, one line of iteration, write, writelines)
+    counts as one read/write operation.
+    """
+
+    def __init__(self, fs, f):
+        self._fs = fs
+        self._f = f
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._fs._transfer("read", 0, inject=True)
+        line = next(self._f)
+        self._fs._transfer("read", len(line))
+        return line
+
+    def read(self, *args):
+        self._fs._transfer("read", 0, inject=True)
+        data = self._f.read(*args)
+        self._fs._transfer("read", len(data))
+        return data
+
+    def readline(self, *args):
+        self._fs._transfer("read", 0, inject=True)
+        line = self._f.readline(*args)
+        self._fs._transfer("read", len(line))
+        return line
+
+    def readlines(self, *args):
+        self._fs._transfer("read", 0, inject=True)
+        lines = self._f.readlines(*args)
+        self._fs._transfer("read", sum(len(line) for line in lines))
+        return lines
+
+    def readinto(self, buf):
+        self._fs._transfer("read", 0, inject=True)
+        n = self._f.readinto(buf)
+        self._fs._transfer("read", n or 0)
+        return n
+
+    def write(self, data):
+        self._fs._transfer("write", len(data), inject=True)
+        return self._f.write(data)
+
+    def writelines(self, lines):
+        lines = list(lines)
+        self._fs._transfer("write", sum(len(line) for line in lines), inject=True)
+        return self._f.writelines(lines)
+
+    def close(self):
+        try:
+            self._fs._fds.discard(self._f.fileno())
+        except (OSError, ValueError):
+            pass
+        self._f.close()
+
+
+class _SlowDirEntry:
+    """ os.DirEntry proxy charging its first stat() as a round trip """
+
+    def __init__(self, fs, entry):
+        self._fs = fs
+        self._entry = entry
+        self._charged = set()
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def __fspath__(self):
+        return self._entry.path
+
+    def stat(self, *, follow_symlinks=True):
+        # DirEntry caches its stat result, so only the first call per kind goes to the server
+        if follow_symlinks not in self._charged:
+            self._charged.add(follow_symlinks)
+            self._fs._meta("stat", self._entry.path)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+class _SlowScandir:
+    """ os.scandir iterator proxy handing out _SlowDirEntry objects """
+
+    def __init__(self, fs, it):
+        self._fs = fs
+        self._it = it
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return _SlowDirEntry(self._fs, next(self._it))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self._it.close()
+
+
+class SlowFS:
+    """
+    Context manager simulating a slow network share.
+    roots:      only paths under these folders are slow (None: every path)
+    latency:    seconds per metadata operation; op_latency overrides it per operation
+    bandwidth:  bytes/second shared by all reads, writes and copies (None: unlimited)
+    errors:     {operation: probability} of failing a call with EIO
+    virtual:    add up simulated time in .elapsed instead of sleeping
+    listing_stats: scandir returns sizes with the listing (Windows SMB); by default
+                each DirEntry.stat() is a stat round trip (Linux NFS/CIFS)
+    """
+
+    def __init__(self, roots=None, latency=0.0, op_latency=None, bandwidth=None,
+                 errors=None, seed=None, virtual=False, listing_stats=False):
+        self.roots = None if roots is None else [os.path.abspath(r) for r in roots]
+        self.latency = latency
+        self.op_latency = dict(op_latency or {})
+        self.bandwidth = bandwidth
+        self.errors = dict(errors or {})
+        self.virtual = virtual
+        self.listing_stats = listing_stats
+        self.random = random.Random(seed)
+        self.stats = {op: _OpStats() for op in OPS}
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._link_free_at = 0.0
+        self._fds = set()
+        self._saved = []
+        self._orig = {}
+
+    # --- Simulation ---
+
+    def _slow(self, path):
+        if isinstance(path, int):
+            return path in self._fds
+        if self.roots is None:
+            return True
+        try:
+            path = os.path.abspath(os.fsdecode(path))
+        except TypeError:
+            return False
+        return any(path == r or path.startswith(r + os.sep) for r in self.roots)
+
+    def _wait(self, seconds):
+        if seconds <= 0:
+            return
+        if self.virtual:
+            with self._lock:
+                self.elapsed += seconds
+        else:
+            time.sleep(seconds)
+
+    def _inject(self, op, target):
+        rate = self.errors.get(op)
+        if rate and self.random.random() < rate:
+            with self._lock:
+                self.stats[op].errors += 1
+            raise OSError(errno.EIO, f"injected {op} error (slowfs)", target)
+
+    def _meta(self, op, target):
+        """ One metadata round trip """
+        delay = self.op_latency.get(op, self.latency)
+        with self._lock:
+            st = self.stats[op]
+            st.calls += 1
+            st.seconds += delay
+        self._wait(delay)
+        self._inject(op, target)
+
+    def _transfer(self, op, nbytes, inject=False):
+        """ Move nbytes over the shared link (inject=True: a new read/write call) """
+        if inject:
+            with self._lock:
+                self.stats[op].calls += 1
+            self._inject(op, None)
+        if not nbytes or not self.bandwidth:
+            with self._lock:
+                self.stats[op].bytes += nbytes
+            return
+        duration = nbytes / self.bandwidth
+        with self._lock:
+            st = self.stats[op]
+            st.bytes += nbytes
+            st.seconds += duration
+            if self.virtual:
+                self.elapsed += duration
+                return
+            now = time.monotonic()
+            start = max(now, self._link_free_at)
+            self._link_free_at = start + duration
+            wait = self._link_free_at - now
+        time.sleep(wait)
+
+    # --- Patching ---
+
+    def _patch(self, module, name, replacement):
+        original = getattr(module, name)
+        self._saved.append((module, name, original))
+        setattr(module, name, replacement)
+        return original
+
+    def _wrap_os(self, name, op):
+        original = getattr(os, name)
+
+        def call(path, *args, **kwargs):
+            if self._slow(path):
+                self._meta(op, path)
+            return original(path, *args, **kwargs)
+
+        def call_two(src, dst, *args, **kwargs):
+            if self._slow(src) or self._slow(dst):
+                self._meta(op, src)
+            return original(src, dst, *args, **kwargs)
+
+        if name == "scandir":
+            def call_scandir(path=".", *args, **kwargs):
+                it = call(path, *args, **kwargs)
+                if self.listing_stats or not self._slow(path):
+                    return it
+                return _SlowScandir(self, it)
+            return call_scandir
+        if name == "listdir":
+            def call_dir(path=".", *args, **kwargs):
+                return call(path, *args, **kwargs)
+            return call_dir
+        return call_two if op == "rename" else call
+
+    def __enter__(self):
+        if self._saved:
+            raise RuntimeError("SlowFS is already active")
+        orig_open = builtins.open
+        orig_os_open = os.open
+        orig_fstat = os.fstat
+
+        def slow_open(file, *args, **kwargs):
+            if not self._slow(file):
+                return orig_open(file, *args, **kwargs)
+            self._meta("open", file)
+            f = orig_open(file, *args, **kwargs)
+            self._fds.add(f.fileno())
+            return _SlowFile(self, f)
+
+        def slow_os_open(path, *args, **kwargs):
+            slow = self._slow(path)
+            if slow:
+                self._meta("open", path)
+            fd = orig_os_open(path, *args, **kwargs)
+            if slow:
+                self._fds.add(fd)
+            return fd
+
+        def slow_fstat(fd):
+            if fd in self._fds:
+                self._meta("stat", fd)
+            return orig_fstat(fd)
+
+        def copy_call(name):
+            original = getattr(os, name)
+
+            def call(a, b, *args, **kwargs):
+                slow = a in self._fds or b in self._fds
+                if slow:
+                    self._transfer("copy", 0, inject=True)
+                n = original(a, b, *args, **kwargs)
+                if slow:
+                    self._transfer("copy", n)
+                return n
+            return call
+
+        for name, op in _OS_CALLS.items():
+            self._patch(os, name, self._wrap_os(name, op))
+        self._patch(os, "open", slow_os_open)
+        self._patch(os, "fstat", slow_fstat)
+        for name in ("copy_file_range", "sendfile"):
+            if hasattr(os, name):
+                self._patch(os, name, copy_call(name))
+        self._patch(builtins, "open", slow_open)
+        return self
+
+    def __exit__(self, *exc):
+        while self._saved:
+            module, name, original = self._saved.pop()
+            setattr(module, name, original)
+        return False
+
+    # --- Results ---
+
+    def calls(self, op=None):
+        """ Calls of one operation, or metadata round trips in total """
+        if op is not None:
+            return self.stats[op].calls
+        return sum(self.stats[o].calls for o in META_OPS)
+
+    def summary(self):
+        """ {operation: {calls, bytes, seconds, errors}} for operations that were used """
+        return {op: {"calls": st.calls, "bytes": st.bytes, "seconds": round(st.seconds, 6), "errors": st.errors}
+                for op, st in self.stats.items() if st.calls or st.bytes}
+
+    def report(self):
+        print("\n[SlowFS] operation      calls        bytes   sim. time  errors")
+        for op, st in self.summary().items():
+            print(f"[SlowFS] {op:<10} {st['calls']:>9} {st['bytes']:>12} {st['seconds']:>10.2f}s {st['errors']:>7}")
+        print(f"[SlowFS] {self.calls()} metadata round trips")
+        if self.virtual:
+            print(f"[SlowFS] simulated I/O time: {self.elapsed:.2f}s")
+
+
+def _op_values(items, scale, flag):
+    """ ["stat=5", ...] -> {"stat": 5 * scale} """
+    values = {}
+    for item in items or ():
+        op, _, value = item.partition("=")
+        if op not in OPS or not value:
+            raise SystemExit(f"{flag}: expected OP=VALUE with OP one of {', '.join(OPS)}, not '{item}'")
+        values[op] = float(value) * scale
+    return values
+
+
+def main(argv=None):
+    from importlib import import_module
+    from .__main__ import COMMANDS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m unlock_music slowfs",
+        description="Run one of the tools against a simulated slow network share and report its I/O.")
+    parser.add_argument("--slow", action="append", metavar="DIR",
+                        help="folder to slow down (repeatable; default: every path)")
+    parser.add_argument("--latency", type=float, default=2.0, metavar="MS",
+                        help="latency per metadata operation in milliseconds (default: 2)")
+    parser.add_argument("--op-latency", action="append", metavar="OP=MS",
+                        help="latency for one operation, e.g. stat=5 (repeatable)")
+    parser.add_argument("--bandwidth", type=float, metavar="MB/S",
+                        help="link bandwidth in MB/s shared by reads, writes and copies")
+    parser.add_argument("--error", action="append", metavar="OP=RATE",
+                        help="fail this fraction of an operation's calls with EIO, e.g. rename=0.01")
+    parser.add_argument("--seed", type=int, help="random seed for injected errors")
+    parser.add_argument("--listing-stats", action="store_true",
+                        help="folder listings include file sizes (Windows SMB); by default every "
+                             "size read from a listing is a stat round trip (Linux NFS/CIFS)")
+    parser.add_argument("--virtual", action="store_true",
+                        help="do not sleep; report the simulated I/O time instead")
+    parser.add_argument("--json", metavar="FILE", help="also write the operation counts as JSON")
+    parser.add_argument("command", choices=[c for c in COMMANDS if c != "slowfs"])
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the tool")
+    args = parser.parse_args(argv)
+    tool_args = args.args[1:] if args.args[:1] == ["--"] else args.args
+
+    fs = SlowFS(args.slow, latency=args.latency / 1000,
+                op_latency=_op_values(args.op_latency, 1 / 1000, "--op-latency"),
+                bandwidth=args.bandwidth * 1e6 if args.bandwidth else None,
+                errors=_op_values(args.error, 1, "--error"), seed=args.seed, virtual=args.virtual,
+                listing_stats=args.listing_stats)
+    module = import_module(f"unlock_music.{COMMANDS[args.command][0]}")
+    start = time.time()
+    with fs:
+        code = module.main(tool_args)
+    fs.report()
+    print(f"[SlowFS] wall time: {time.time() - start:.2f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"command": [args.command] + tool_args, "exit_code": code,
+                       "round_trips": fs.calls(), "elapsed": fs.elapsed, "ops": fs.summary()}, f, indent=2)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import base64
+import struct
+import hashlib
+
+from .profiling import NULL_PROFILER
+
+# Pre-decrypt deduplication of the encrypted source folder.
+#
+# Browsers leave "Song (1).ncm" / "Song (2).mflac" copies of one download.
+# Instead of decrypting every copy and letting clean.py delete the "(N)"
+# outputs afterwards, unlock.py groups the sources first and decrypts one
+# representative per group:
+#   exact      same size and same partial hash (head, middle and tail chunks)
+#   same-song  NCM files carrying the same NetEase musicId in their meta block
+# The other members are recorded in output/duplicates.json as copies of the
+# representative, so clean.py can count them as processed and archive.py
+# moves or deletes them together with it. The partial hash is only good
+# enough to skip a decrypt: archive.py compares the full contents
+# (same_content) before it deletes an "exact" copy.
+
+DUPLICATES_NAME = "duplicates.json"
+
+EXACT = "exact"
+SAME_SONG = "same-song"
+
+PARTIAL_CHUNK = 64 * 1024
+COMPARE_CHUNK = 1024 * 1024
+
+NCM_MAGIC = b"CTENFDAM"
+NCM_META_PREFIX = b"163 key(Don't modify):"
+
+# "Song (1)" -> "Song"
+_COPY_SUFFIX = re.compile(r"\s*\((\d+)\)$")
+
+
+def partial_hash(path, size):
+    """ sha1 over the first, middle and last PARTIAL_CHUNK bytes """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        if size <= 3 * PARTIAL_CHUNK:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2, size - PARTIAL_CHUNK):
+                f.seek(offset)
+                h.update(f.read(PARTIAL_CHUNK))
+    return h.hexdigest()
+
+
+def same_content(a, b):
+    """ True if the two files are byte-for-byte identical """
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            chunk = fa.read(COMPARE_CHUNK)
+            if chunk != fb.read(COMPARE_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def ncm_identity(path):
+    """
+    A key identifying the NetEase track inside an .ncm file, or None.
+
+    The meta block is AES-128-ECB under a fixed key, so every 16-byte block
+    is encrypted independently and deterministically. Its plaintext starts
+    with 'music:{"musicId":<id>,"musicName"', which makes the first two
+    ciphertext blocks a function of the musicId alone. Comparing them finds
+    the same song without decrypting (there is no AES in the standard library).
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(8) != NCM_MAGIC:
+                return None
+            f.seek(2, os.SEEK_CUR)
+            (key_len,) = struct.unpack("<I", f.read(4))
+            f.seek(key_len, os.SEEK_CUR)
+            (meta_len,) = struct.unpack("<I", f.read(4))
+            # 44 base64 characters decode to the 32 bytes we need
+            wanted = len(NCM_META_PREFIX) + 44
+            if meta_len < wanted:
+                return None
+            meta = bytes(b ^ 0x63 for b in f.read(wanted))
+    except (OSError, struct.error):
+        return None
+    if not meta.startswith(NCM_META_PREFIX):
+        return None
+    try:
+        blocks = base64.b64decode(meta[len(NCM_META_PREFIX):])[:32]
+    except ValueError:
+        return None
+    return blocks.hex() if len(blocks) == 32 else None
+
+
+def _representative_key(name, size):
+    """
+    Prefer the largest copy: for the same song that is the better download
+    (FLAC over MP3), which must be the one decrypted. Among equal sizes
+    (byte-identical copies) prefer a name without a '(N)' suffix. A "(N)"
+    representative keeps its name: clean.py leaves its output alone and
+    archive.py files the group under it.
+    """
+    stem = os.path.splitext(name)[0]
+    return (-size, bool(_COPY_SUFFIX.search(stem)), len(name), name)
+
+
+def find_duplicates(source_dir, names, prof=NULL_PROFILER):
+    """
+    Group encrypted files in source_dir. Returns {duplicate: (representative, match)}
+    where match is EXACT or SAME_SONG. Files not listed are unique.
+    """
+    sizes = {}
+    for name in names:
+        try:
+            sizes[name] = os.path.getsize(os.path.join(source_dir, name))
+        except OSError:
+            pass
+
+    # Union-find over both criteria
+    parent = {name: name for name in sizes}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(group):
+        root = find(group[0])
+        for other in group[1:]:
+            parent[find(other)] = root
+
+    by_size = {}
+    for name, size in sizes.items():
+        by_size.setdefault(size, []).append(name)
+
+    # Only files sharing a size are ever read
+    by_partial = {}
+    for size, group in by_size.items():
+        if len(group) < 2:
+            continue
+        for name in group:
+            try:
+                with prof.span("dedup", file=name):
+                    digest = partial_hash(os.path.join(source_dir, name), size)
+            except OSError:
+                continue
+            by_partial.setdefault((size, digest), []).append(name)
+    for group in by_partial.values():
+        if len(group) > 1:
+            union(group)
+
+    by_song = {}
+    for name in sizes:
+        if name.lower().endswith(".ncm"):
+            with prof.span("dedup", file=name):
+                identity = ncm_identity(os.path.join(source_dir, name))
+            if identity:
+                by_song.setdefault(identity, []).append(name)
+    for group in by_song.values():
+        if len(group) > 1:
+            union(group)
+
+    components = {}
+    for name in sizes:
+        components.setdefault(find(name), []).append(name)
+
+    exact_key = {}
+    for key, group in by_partial.items():
+        for name in group:
+            exact_key[name] = key
+
+    duplicates = {}
+    for group in components.values():
+        if len(group) < 2:
+            continue
+        rep = min(group, key=lambda n: _representative_key(n, sizes[n]))
+        for name in group:
+            if name == rep:
+                continue
+            same_bytes = name in exact_key and exact_key.get(name) == exact_key.get(rep)
+            duplicates[name] = (rep, EXACT if same_bytes else SAME_SONG)
+    return duplicates
+
+
+class DuplicateLog:
+    """ output/duplicates.json: duplicate source name -> {"of": representative, "match": kind} """
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, DUPLICATES_NAME)
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[!] Duplicate log unreadable, starting fresh: {e}")
+
+    def update(self, duplicates):
+        """ Replace the entries with the result of a full scan of the source folder """
+        entries = {name: {"of": rep, "match": match} for name, (rep, match) in duplicates.items()}
+        if entries != self.entries:
+            self.dirty = True
+        self.entries = entries
+
+    def representative_of(self, name):
+        """ The representative name is a recorded copy of, or None """
+        entry = self.entries.get(name)
+        return entry.get("of") if entry else None
+
+    def duplicates_of(self, rep):
+        """ [(name, match)] recorded as copies of rep """
+        return [(name, e["match"]) for name, e in self.entries.items() if e.get("of") == rep]
+
+    def forget(self, name):
+        if self.entries.pop(name, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
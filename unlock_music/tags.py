@@ -0,0 +1,278 @@
+import os
+import struct
+
+# Minimal tag readers for the decrypted outputs (FLAC metadata blocks and
+# ID3v2.3/2.4 on MP3), plus MPEG frame header parsing. Standard library only;
+# used by covers.py (embedded art), library_index.py (title/artist/duration).
+
+MIME_EXTS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+}
+
+
+def sniff_image_ext(data, mime=""):
+    """ Pick a file extension from magic bytes, falling back to the mime type """
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    return MIME_EXTS.get(mime.lower(), ".jpg")
+
+
+# ================================
+# Tag parsing (FLAC / ID3v2)
+# ================================
+
+def syncsafe(b):
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+
+def to_syncsafe(n):
+    return bytes([(n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f])
+
+
+def id3_size(f):
+    """ Size of a leading ID3v2 tag (0 if none). File position is restored. """
+    pos = f.tell()
+    head = f.read(10)
+    f.seek(pos)
+    if len(head) == 10 and head[:3] == b"ID3":
+        size = 10 + syncsafe(head[6:10])
+        if head[5] & 0x10:  # footer present
+            size += 10
+        return size
+    return 0
+
+
+def read_flac_blocks(f):
+    """ Returns (list of (type, is_last, payload), audio_offset) or None if not FLAC """
+    f.seek(id3_size(f))
+    if f.read(4) != b"fLaC":
+        return None
+    blocks = []
+    while True:
+        head = f.read(4)
+        if len(head) < 4:
+            return None
+        is_last = bool(head[0] & 0x80)
+        btype = head[0] & 0x7f
+        length = int.from_bytes(head[1:4], "big")
+        payload = f.read(length)
+        if len(payload) < length:
+            return None
+        blocks.append((btype, is_last, payload))
+        if is_last:
+            return blocks, f.tell()
+
+
+def parse_flac_picture(payload):
+    pos = 4  # picture type
+    mime_len = struct.unpack(">I", payload[pos:pos + 4])[0]
+    pos += 4
+    mime = payload[pos:pos + mime_len].decode("ascii", "replace")
+    pos += mime_len
+    desc_len = struct.unpack(">I", payload[pos:pos + 4])[0]
+    pos += 4 + desc_len + 16  # description, width, height, depth, colors
+    data_len = struct.unpack(">I", payload[pos:pos + 4])[0]
+    pos += 4
+    return payload[pos:pos + data_len], mime
+
+
+def parse_vorbis_comments(payload):
+    comments = {}
+    pos = 0
+    vendor_len = struct.unpack("<I", payload[pos:pos + 4])[0]
+    pos += 4 + vendor_len
+    count = struct.unpack("<I", payload[pos:pos + 4])[0]
+    pos += 4
+    for _ in range(count):
+        n = struct.unpack("<I", payload[pos:pos + 4])[0]
+        pos += 4
+        entry = payload[pos:pos + n].decode("utf-8", "replace")
+        pos += n
+        if "=" in entry:
+            key, value = entry.split("=", 1)
+            comments.setdefault(key.upper(), value)
+    return comments
+
+
+def read_id3_frames(f):
+    """ Returns (version, flags, list of (id, frame_flags, payload), tag_size) or None """
+    head = f.read(10)
+    if len(head) < 10 or head[:3] != b"ID3":
+        return None
+    version, flags = head[3], head[5]
+    tag_size = 10 + syncsafe(head[6:10])
+    if version not in (3, 4) or flags & 0x80:
+        # v2.2 frames and unsynchronised tags are rare; leave them alone
+        return None
+    body = f.read(tag_size - 10)
+    pos = 0
+    if flags & 0x40:  # extended header
+        ext = body[0:4]
+        pos = syncsafe(ext) if version == 4 else struct.unpack(">I", ext)[0] + 4
+    frames = []
+    while pos + 10 <= len(body):
+        fid = body[pos:pos + 4]
+        if fid[0] == 0:  # padding
+            break
+        raw = body[pos + 4:pos + 8]
+        size = syncsafe(raw) if version == 4 else struct.unpack(">I", raw)[0]
+        fflags = body[pos + 8:pos + 10]
+        frames.append((fid.decode("latin-1"), fflags, body[pos + 10:pos + 10 + size]))
+        pos += 10 + size
+    return version, flags, frames, tag_size
+
+
+def decode_id3_text(payload):
+    if not payload:
+        return ""
+    enc = payload[0]
+    data = payload[1:]
+    codec = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(enc, "latin-1")
+    return data.decode(codec, "replace").split("\x00")[0].strip()
+
+
+def parse_apic(payload):
+    enc = payload[0]
+    end = payload.index(b"\x00", 1)
+    mime = payload[1:end].decode("latin-1")
+    pos = end + 2  # null + picture type
+    if enc in (1, 2):
+        # UTF-16 description ends on an aligned double null
+        while pos + 1 < len(payload) and payload[pos:pos + 2] != b"\x00\x00":
+            pos += 2
+        pos += 2
+    else:
+        pos = payload.index(b"\x00", pos) + 1
+    return payload[pos:], mime
+
+
+# ================================
+# Stream info
+# ================================
+
+def parse_streaminfo(payload):
+    """ FLAC STREAMINFO -> (sample_rate, channels, bits_per_sample, total_samples, md5) """
+    packed = int.from_bytes(payload[10:18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1f) + 1
+    total_samples = packed & ((1 << 36) - 1)
+    return sample_rate, channels, bits, total_samples, payload[18:34]
+
+
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+
+
+def parse_mp3_header(b):
+    """
+    Decode a 4-byte MPEG audio frame header.
+    Returns dict(version, layer, bitrate, sample_rate, samples, length, mono) or None.
+    """
+    if len(b) < 4 or b[0] != 0xff or (b[1] & 0xe0) != 0xe0:
+        return None
+    version = {0: 25, 2: 2, 3: 1}.get((b[1] >> 3) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((b[1] >> 1) & 0x3)
+    br_index = b[2] >> 4
+    sr_index = (b[2] >> 2) & 0x3
+    if version is None or layer is None or br_index in (0, 15) or sr_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][br_index] * 1000
+    sample_rate = _MP3_RATES[version][sr_index]
+    padding = (b[2] >> 1) & 0x1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 1) else 576
+        length = (samples // 8) * bitrate // sample_rate + padding
+    return {
+        "version": version, "layer": layer, "bitrate": bitrate, "sample_rate": sample_rate,
+        "samples": samples, "length": length, "mono": (b[3] >> 6) == 3,
+    }
+
+
+def mp3_duration(f, audio_offset, file_size):
+    """ Seconds of audio: Xing/Info frame count when present, else a CBR estimate """
+    f.seek(audio_offset)
+    head = f.read(4096)
+    hdr = None
+    pos = head.find(b"\xff")
+    while pos != -1 and pos + 4 <= len(head):
+        hdr = parse_mp3_header(head[pos:pos + 4])
+        if hdr:
+            break
+        pos = head.find(b"\xff", pos + 1)
+    if not hdr:
+        return None
+    side = (17 if hdr["mono"] else 32) if hdr["version"] == 1 else (9 if hdr["mono"] else 17)
+    xing = head[pos + 4 + side:pos + 4 + side + 12]
+    if xing[:4] in (b"Xing", b"Info") and struct.unpack(">I", xing[4:8])[0] & 0x1:
+        frames = struct.unpack(">I", xing[8:12])[0]
+        return frames * hdr["samples"] / hdr["sample_rate"]
+    return (file_size - audio_offset - pos) * 8 / hdr["bitrate"]
+
+
+def read_tags(path, want_picture=False):
+    """
+    Read common tags from a decrypted FLAC or MP3.
+    Returns a dict with any of: title, artist, album, album_artist,
+    duration (seconds), picture (bytes), picture_ext. Missing or unreadable fields are left out.
+    """
+    tags = {}
+    try:
+        with open(path, "rb") as f:
+            flac = read_flac_blocks(f)
+            if flac:
+                for btype, _, payload in flac[0]:
+                    if btype == 0:
+                        sample_rate, _, _, total, _ = parse_streaminfo(payload)
+                        if sample_rate and total:
+                            tags["duration"] = total / sample_rate
+                    elif btype == 4 and "title" not in tags:
+                        comments = parse_vorbis_comments(payload)
+                        for key, name in (("TITLE", "title"), ("ARTIST", "artist"), ("ALBUM", "album"),
+                                          ("ALBUMARTIST", "album_artist")):
+                            if comments.get(key):
+                                tags[name] = comments[key]
+                    elif btype == 6 and want_picture and "picture" not in tags:
+                        data, mime = parse_flac_picture(payload)
+                        tags["picture"], tags["picture_ext"] = data, sniff_image_ext(data, mime)
+                return tags
+
+            f.seek(0)
+            audio_offset = id3_size(f)
+            id3 = read_id3_frames(f)
+            if id3:
+                text_frames = {"TIT2": "title", "TPE1": "artist", "TALB": "album", "TPE2": "album_artist"}
+                for fid, _, payload in id3[2]:
+                    if fid in text_frames and text_frames[fid] not in tags:
+                        value = decode_id3_text(payload)
+                        if value:
+                            tags[text_frames[fid]] = value
+                    elif fid == "TLEN" and "duration" not in tags:
+                        try:
+                            tags["duration"] = int(decode_id3_text(payload)) / 1000
+                        except ValueError:
+                            pass
+                    elif fid == "APIC" and want_picture and "picture" not in tags:
+                        data, mime = parse_apic(payload)
+                        tags["picture"], tags["picture_ext"] = data, sniff_image_ext(data, mime)
+            if "duration" not in tags:
+                duration = mp3_duration(f, audio_offset, os.fstat(f.fileno()).st_size)
+                if duration:
+                    tags["duration"] = duration
+    except (OSError, ValueError, struct.error, IndexError, ZeroDivisionError):
+        pass
+    return tags
@@ -0,0 +1,157 @@
+import os
+import sys
+import errno
+import shutil
+
+# File transfer layer for archive.py.
+#
+# shutil.move only knows "rename, else copy in user space". This picks the
+# cheapest primitive per file pair, in order:
+#   rename          same filesystem: metadata-only, effectively free
+#   reflink         FICLONE ioctl (Btrfs/XFS/bcachefs): shares extents, no data copied
+#   copy_file_range in-kernel copy (Linux), server-side on NFS 4.2 / some SMB
+#   sendfile        in-kernel copy on older Linux kernels
+#   CopyFileW       Windows; lets SMB do a server-side copy where supported
+#   buffered        plain read/write loop, last resort
+# Copies go to "<dst>.part" first and are renamed into place, so an
+# interrupted transfer never leaves a truncated file under the real name.
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int)
+BUFFER_SIZE = 1024 * 1024
+
+# errnos meaning "this primitive does not work for this pair of filesystems".
+# Only these are remembered; anything else (EPERM, EBADF, EIO, ...) may be
+# specific to one file, so that file falls back to the next primitive and
+# the pair keeps using the fast path for the rest.
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, getattr(errno, "EOPNOTSUPP", 95), getattr(errno, "ENOTSUP", 95)}
+# FICLONE also reports "can't clone here" as EINVAL (unaligned/other fs) or ENOTTY (no such ioctl)
+_UNSUPPORTED_REFLINK = _UNSUPPORTED | {errno.EINVAL, errno.ENOTTY}
+# CopyFileW: ERROR_INVALID_FUNCTION, ERROR_NOT_SUPPORTED
+_UNSUPPORTED_WINERROR = {1, 50}
+
+# (method, src_dev, dst_dev) pairs already known not to work; skips repeat failing syscalls
+_known_unsupported = set()
+
+# folder -> st_dev; a stat per file pair is a network round trip on SMB/NFS
+_dir_devs = {}
+
+
+def _unsupported(method, devs, err):
+    """ Remember method as unusable for devs if err is a capability error """
+    if method == "copyfile":
+        unsupported = getattr(err, "winerror", None) in _UNSUPPORTED_WINERROR
+    else:
+        unsupported = err.errno in (_UNSUPPORTED_REFLINK if method == "reflink" else _UNSUPPORTED)
+    if unsupported:
+        _known_unsupported.add((method,) + devs)
+    return unsupported
+
+
+def _reflink(fsrc, fdst):
+    import fcntl
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy_file_range(fsrc, fdst, size):
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(fsrc, fdst, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(fdst.fileno(), fsrc.fileno(), copied, min(size - copied, 1 << 30))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_windows(src, dst):
+    import ctypes
+    if not ctypes.windll.kernel32.CopyFileW(src, dst, False):
+        raise ctypes.WinError()
+
+
+def _dir_dev(path):
+    """ st_dev of the folder containing path, stat'ed once per folder """
+    folder = os.path.dirname(os.path.abspath(path))
+    dev = _dir_devs.get(folder)
+    if dev is None:
+        dev = _dir_devs[folder] = os.stat(folder).st_dev
+    return dev
+
+
+def _copy_data(src, tmp_dst, devs):
+    """ Copy src into tmp_dst with the cheapest working primitive. Returns its name. """
+    if sys.platform == "win32" and ("copyfile",) + devs not in _known_unsupported:
+        try:
+            _copy_windows(src, tmp_dst)
+            return "copyfile"
+        except OSError as e:
+            _unsupported("copyfile", devs, e)
+
+    size = os.path.getsize(src)
+    with open(src, "rb") as fsrc, open(tmp_dst, "wb") as fdst:
+        candidates = []
+        if sys.platform.startswith("linux"):
+            candidates.append(("reflink", lambda: _reflink(fsrc, fdst)))
+        if hasattr(os, "copy_file_range"):
+            candidates.append(("copy_file_range", lambda: _copy_file_range(fsrc, fdst, size)))
+        if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+            candidates.append(("sendfile", lambda: _sendfile(fsrc, fdst, size)))
+
+        for method, fn in candidates:
+            if (method,) + devs in _known_unsupported:
+                continue
+            try:
+                fn()
+                if os.fstat(fdst.fileno()).st_size == size:
+                    return method
+            except OSError as e:
+                _unsupported(method, devs, e)
+            # Nothing usable was written; start over with the next primitive
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        shutil.copyfileobj(fsrc, fdst, BUFFER_SIZE)
+        return "buffered"
+
+
+def move_file(src, dst):
+    """
+    Move one file, overwriting dst. Returns the primitive used
+    ('rename', 'reflink', 'copy_file_range', 'sendfile', 'copyfile' or 'buffered').
+    """
+    src_dev = _dir_dev(src)
+    dst_dev = _dir_dev(dst)
+    devs = (src_dev, dst_dev)
+
+    if src_dev == dst_dev and ("rename",) + devs not in _known_unsupported:
+        try:
+            os.replace(src, dst)
+            return "rename"
+        except OSError as e:
+            # Same st_dev can still be EXDEV (e.g. bind mounts); fall through to copying.
+            # A real error (EACCES, ENOSPC...) is raised again by the copy below.
+            _unsupported("rename", devs, e)
+
+    tmp_dst = dst + ".part"
+    try:
+        method = _copy_data(src, tmp_dst, devs)
+        shutil.copystat(src, tmp_dst)
+        os.replace(tmp_dst, dst)
+    except BaseException:
+        try:
+            os.remove(tmp_dst)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    return method
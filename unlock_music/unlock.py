@@ -0,0 +1,346 @@
+import os
+import time
+import shutil
+import subprocess
+
+from . import TOOL_DIR
+from .events import RunResult, UsageError, notify, is_cancelled
+from .profiling import NULL_PROFILER
+from .metrics import NULL_METRICS, file_format
+from .failures import (PERMANENT, TRANSIENT, MAX_ATTEMPTS, CACHE_NAME, NegativeCache, classify,
+                       backoff_delay, still_being_written, keys_fingerprint, um_key_sources,
+                       format_failed_line, last_error_line, load_failed_log, write_failed_log)
+
+# Kill um if a single file takes longer than this (seconds)
+UM_TIMEOUT = 600
+# How often a running um checks for cancellation (seconds)
+CANCEL_POLL = 0.5
+
+# Sources skipped because their name matches a library track, for the user to review
+OWNED_REVIEW_NAME = "owned_review.log"
+
+TARGET_EXTS = ('.ncm', '.qmc0', '.qmc3', '.qmcflac', '.qmcogg', '.mgg', '.mflac',
+               '.bkcmp3', '.bkcflac', '.tm0', '.tm3', '.kwm', '.kgm')
+
+
+class UnlockResult(RunResult):
+    tool = "unlock"
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0
+        self.success = 0
+        self.transient = 0
+        self.skipped_cached = 0
+        self.skipped_owned = 0
+        self.skipped_duplicate = 0
+        self.predicted_seconds = None
+        self.actual_seconds = None
+        self.workers = None
+
+
+def find_um(um_path=None):
+    """ um_path, else cli/um.exe next to the package, else 'um' on PATH """
+    candidates = [um_path] if um_path else [os.path.join(TOOL_DIR, "cli", "um.exe"), shutil.which("um")]
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    raise UsageError(f"'um.exe' not found at: {um_path or candidates[0]}. "
+                     "Please run the compilation step first or pass --um.")
+
+
+def run_um(cmd, fname, prof, timeout=UM_TIMEOUT, cancel=None):
+    """
+    Run um once. Returns (returncode, output); returncode is None on timeout
+    or cancellation.
+    """
+    # Popen + communicate (instead of run) so spawn and decrypt time can be told apart.
+    # um logs errors to stdout, so both streams are merged for classification.
+    with prof.span("spawn", file=fname):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding='utf-8', errors='replace')
+    deadline = time.monotonic() + timeout
+    with prof.span("decrypt", file=fname):
+        while True:
+            try:
+                output, _ = proc.communicate(timeout=CANCEL_POLL if cancel is not None else timeout)
+                return proc.returncode, output
+            except subprocess.TimeoutExpired:
+                if is_cancelled(cancel) or time.monotonic() >= deadline:
+                    proc.kill()
+                    output, _ = proc.communicate()
+                    return None, output
+
+
+def run_unlock(input_dir, *, output_dir=None, um_path=None, library_dir=None, workers=None,
+               cost_model_path=None, prof=NULL_PROFILER, metrics=NULL_METRICS,
+               progress=None, cancel=None):
+    """
+    Decrypt every supported file in input_dir into output_dir (default:
+    <input_dir>/output). Returns an UnlockResult; raises UsageError for a
+    missing folder or um binary.
+    """
+    from .library_index import LibraryIndex
+    from .scheduler import COST_MODEL_NAME, CostModel, run_scheduled
+    from .source_dedup import DuplicateLog, find_duplicates
+
+    um_path = find_um(um_path)
+    if not os.path.isdir(input_dir):
+        raise UsageError(f"input directory not found: {input_dir}")
+    output_dir = output_dir or os.path.join(input_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    result = UnlockResult()
+
+    # Scan for valid encrypted files
+    print(f"\nScanning: {input_dir}")
+    with prof.span("scan", dir=input_dir):
+        all_files = os.listdir(input_dir)
+    with prof.span("triage", candidates=len(all_files)):
+        files_to_process = [f for f in all_files if f.lower().endswith(TARGET_EXTS)]
+
+    if not files_to_process:
+        print("No supported encrypted files found.")
+        print(f"Supported extensions: {TARGET_EXTS}")
+        return result
+
+    result.total = len(files_to_process)
+    print(f"Found {len(files_to_process)} encrypted files.\n")
+    print(f"Output Directory: {output_dir}\n")
+    metrics.watch_dir("output", output_dir)
+    for fname in files_to_process:
+        metrics.inc("files_queued_total", format=file_format(fname))
+
+    # Failure history: failed.log (human readable) + negative cache (content keyed)
+    failed_log_path = os.path.join(output_dir, "failed.log")
+    failed_entries = load_failed_log(failed_log_path)
+    neg_cache = NegativeCache(os.path.join(output_dir, CACHE_NAME),
+                              keys_fingerprint(um_key_sources(um_path, input_dir)))
+
+    # Songs already archived in the library (matched by normalized name, before any decrypt work)
+    library = None
+    if library_dir:
+        library = LibraryIndex(library_dir)
+        if len(library) == 0:
+            print(f"[!] Library index at {library.index_path} is empty; run library_index.py or archive.py first.")
+        else:
+            print(f"[Library] {len(library)} archived tracks loaded.")
+
+    # Browser copies ("Song (1).ncm"): decrypt one representative per group
+    dup_log = DuplicateLog(output_dir)
+    with prof.span("dedup", candidates=result.total):
+        duplicates = find_duplicates(input_dir, files_to_process, prof)
+    dup_log.update(duplicates)
+    for fname, (rep, match) in sorted(duplicates.items()):
+        print(f"[DUP] {fname}: {match} copy of {rep}")
+        failed_entries.pop(fname, None)
+        metrics.inc("files_skipped_total", format=file_format(fname), reason="duplicate")
+        notify(progress, "unlock", "dedup", fname, "duplicate")
+    result.skipped_duplicate = len(duplicates)
+    files_to_process = [f for f in files_to_process if f not in duplicates]
+
+    # Triage (cheap, sequential): drop cached failures and owned songs before scheduling
+    queue = []  # (fname, size, format)
+    owned_review = {}  # fname -> library relpath with the same normalized name
+    for fname in files_to_process:
+        full_path = os.path.join(input_dir, fname)
+        fmt = file_format(fname)
+
+        try:
+            with prof.span("triage", file=fname):
+                st = os.stat(full_path)
+                cached = neg_cache.lookup(full_path, st)
+        except OSError:
+            st, cached = None, None
+        if cached:
+            print(f"[SKIP] {fname}: known permanent failure ({cached['reason']})")
+            result.skipped_cached += 1
+            metrics.inc("files_skipped_total", format=fmt, reason=cached['reason'])
+            notify(progress, "unlock", "triage", fname, "skipped")
+            continue
+
+        owned = library.find_name(os.path.splitext(fname)[0]) if library else None
+        if owned:
+            # A name match is only a hint: not decrypted, but listed for review
+            print(f"[OWNED?] {fname}: same name as library track {owned}. Not decrypted, see {OWNED_REVIEW_NAME}.")
+            owned_review[fname] = owned
+            result.skipped_owned += 1
+            metrics.inc("files_skipped_total", format=fmt, reason="owned")
+            notify(progress, "unlock", "triage", fname, "review")
+            continue
+
+        queue.append((fname, st.st_size if st else 0, fmt))
+
+    def decrypt(fname):
+        """ Runs on a worker thread: um with retries. Bookkeeping happens in on_done. """
+        if is_cancelled(cancel):
+            return {"cancelled": True}
+        full_path = os.path.join(input_dir, fname)
+        cmd = [um_path, "-i", full_path, "-o", output_dir]
+        fmt = file_format(fname)
+        metrics.add("files_in_flight", 1)
+        try:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                before = os.stat(full_path)
+                started = time.monotonic()
+                returncode, output = run_um(cmd, fname, prof, cancel=cancel)
+                if returncode == 0:
+                    return {"returncode": 0, "seconds": time.monotonic() - started}
+                if is_cancelled(cancel):
+                    return {"cancelled": True}
+
+                kind, reason = classify(returncode, output)
+                if still_being_written(before, full_path):
+                    # A half-downloaded file can look like any kind of garbage
+                    kind, reason = TRANSIENT, "incomplete"
+                if kind == PERMANENT or attempt == MAX_ATTEMPTS:
+                    break
+
+                delay = backoff_delay(attempt)
+                print(f"[Retry] {fname}: {reason}, retry {attempt}/{MAX_ATTEMPTS - 1} in {delay:.0f}s")
+                metrics.inc("retries_total", format=fmt, reason=reason)
+                if cancel is not None:
+                    if cancel.wait(delay):
+                        return {"cancelled": True}
+                else:
+                    time.sleep(delay)
+            return {"returncode": returncode, "kind": kind, "reason": reason,
+                    "detail": last_error_line(output)}
+        finally:
+            metrics.add("files_in_flight", -1)
+            metrics.set("last_progress_timestamp_seconds", time.time())
+
+    finished = 0
+
+    def on_done(fname, outcome, exc):
+        nonlocal finished
+        if outcome and outcome.get("cancelled"):
+            return
+        finished += 1
+        full_path = os.path.join(input_dir, fname)
+        fmt = file_format(fname)
+        prefix = f"[{finished}/{len(queue)}] {fname}"
+        if exc is not None:
+            print(f"{prefix} [Error: {exc}]")
+            result.failed += 1
+            result.transient += 1
+            failed_entries[fname] = format_failed_line(fname, TRANSIENT, "error", str(exc))
+            metrics.inc("files_failed_total", format=fmt, action="decrypt", kind=TRANSIENT, reason="error")
+            status = "failed"
+        elif outcome["returncode"] == 0:
+            print(f"{prefix} [OK] {outcome['seconds']:.1f}s")
+            result.success += 1
+            failed_entries.pop(fname, None)
+            try:
+                neg_cache.discard(full_path)
+                metrics.inc("bytes_decrypted_total", os.path.getsize(full_path), format=fmt)
+            except OSError:
+                pass
+            metrics.inc("files_done_total", format=fmt, action="decrypt")
+            status = "ok"
+        else:
+            kind, reason, detail = outcome["kind"], outcome["reason"], outcome["detail"]
+            print(f"{prefix} [FAILED: {kind} {reason}]")
+            print(f"    Error: {detail}")
+            result.failed += 1
+            if kind == PERMANENT:
+                try:
+                    neg_cache.add(full_path, reason, detail)
+                except OSError:
+                    pass
+            else:
+                result.transient += 1
+            failed_entries[fname] = format_failed_line(fname, kind, reason, detail)
+            metrics.inc("files_failed_total", format=fmt, action="decrypt", kind=kind, reason=reason)
+            status = "failed"
+        notify(progress, "unlock", "decrypt", fname, status, finished, len(queue))
+
+    # Largest predicted cost first; the worker count tunes itself unless workers is given
+    cost_model = CostModel(cost_model_path or os.path.join(TOOL_DIR, COST_MODEL_NAME))
+    # Logs and caches are written even if the run is aborted (second Ctrl+C)
+    try:
+        if queue:
+            mode = f"{workers} workers" if workers else "auto-tuned workers"
+            print(f"\nUnlocking {len(queue)} files (largest first, {mode})...\n")
+            schedule = run_scheduled(queue, decrypt, on_done, cost_model, workers=workers, cancel=cancel)
+            result.predicted_seconds = schedule["predicted"]
+            result.actual_seconds = schedule["actual"]
+            result.workers = schedule["workers"]
+    finally:
+        result.cancelled = is_cancelled(cancel)
+        with prof.span("log-write", log="failed.log"):
+            try:
+                if queue:
+                    cost_model.save()
+                write_failed_log(failed_log_path, failed_entries)
+                if library is not None:
+                    with open(os.path.join(output_dir, OWNED_REVIEW_NAME), "w", encoding="utf-8") as f:
+                        for fname, owned in sorted(owned_review.items()):
+                            f.write(f"{fname}\t{owned}\n")
+                neg_cache.save()
+                dup_log.save()
+            except OSError as e:
+                print(f"[!] Error writing logs and caches: {e}")
+
+    print("\n" + "="*30)
+    print("SUMMARY")
+    print("="*30)
+    print(f"Total Processed: {result.total}")
+    print(f"Success:         {result.success}")
+    print(f"Failed:          {result.failed} ({result.transient} transient, will retry next run)")
+    print(f"Skipped (cached): {result.skipped_cached}")
+    print(f"Skipped (duplicate): {result.skipped_duplicate}")
+    if library:
+        print(f"Skipped (owned?): {result.skipped_owned}")
+        if result.skipped_owned:
+            print(f"    Same name as a library track, listed in '{OWNED_REVIEW_NAME}' for review.")
+            print("    Run without --library to decrypt them anyway.")
+    if result.actual_seconds is not None:
+        print(f"Time:            {result.actual_seconds:.1f}s (predicted {result.predicted_seconds:.1f}s, "
+              f"finished with {result.workers} workers)")
+    if result.cancelled:
+        print("Cancelled:       remaining files were not started.")
+
+    if result.failed > 0:
+        print("\nNote: Permanent failures (unsupported format, no decoder, missing key) are cached")
+        print(f"by content in '{CACHE_NAME}' and skipped until the file or available keys change.")
+
+    print("\n[Done] Task completed.")
+    return result
+
+
+def add_unlock_args(parser):
+    parser.add_argument("input_dir", nargs="?",
+                        help="folder containing the encrypted files (asked for when omitted on a console)")
+    parser.add_argument("--output", dest="output_dir", metavar="DIR",
+                        help="where decrypted files go (default: <input_dir>/output)")
+    parser.add_argument("--um", dest="um_path", metavar="PATH",
+                        help="path of the um executable (default: cli/um.exe, then 'um' on PATH)")
+    parser.add_argument("--library", metavar="DEST_DIR",
+                        help="archive destination whose library index is used to hold back songs with a known name "
+                             f"(listed in output/{OWNED_REVIEW_NAME})")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="number of parallel um processes (default: tuned automatically)")
+
+
+def main(argv=None):
+    from .cli import parse_args, interactive, ask_path, run_tool, cancel_on_signals
+
+    prof, metrics, args = parse_args("unlock", argv, add_unlock_args,
+                                     "Batch-decrypt downloaded music with the um CLI.")
+    prompt = args.input_dir is None and interactive()
+
+    def run():
+        print("=== Native Fast Unlocker (Powered by Go CLI) ===")
+        print("This tool uses the compiled 'um.exe' for high-speed, stable decryption.")
+        um_path = find_um(args.um_path)
+        input_dir = args.input_dir
+        if prompt:
+            input_dir = ask_path("\nEnter input directory containing encrypted files:", TOOL_DIR)
+        if not input_dir:
+            raise UsageError("no input directory given")
+        with cancel_on_signals("unlock") as cancel:
+            return run_unlock(input_dir, output_dir=args.output_dir, um_path=um_path,
+                              library_dir=args.library, workers=args.workers,
+                              prof=prof, metrics=metrics, cancel=cancel).exit_code
+
+    return run_tool("unlock", run, prof, metrics, pause=prompt)
@@ -0,0 +1,372 @@
+import os
+import sys
+import mmap
+import zlib
+import shutil
+import struct
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from .tags import id3_size, read_flac_blocks, parse_streaminfo, parse_mp3_header
+
+# Structural integrity check of decrypted audio, used by archive.py to keep
+# truncated or garbled outputs (and their originals) out of the archive.
+#
+# Everything works on an mmap of the file and touches only container
+# structure, never decodes audio:
+#   FLAC  metadata chain, first frame header, and the final frame (header
+#         CRC-8 + frame CRC-16) whose sample position must reach the
+#         STREAMINFO sample count
+#   MP3   frame-sync continuity from the first frame to the end of the audio,
+#         plus the Xing/Info frame count when present
+#   Ogg   every page: capture pattern, CRC, sequence numbers and an
+#         end-of-stream page at the end
+# The optional FLAC MD5 check needs a full decode and is delegated to the
+# reference 'flac' tool ('flac --test') when it is installed.
+# Files are checked in a process pool, so a night's output is CPU-bound
+# on all cores rather than on one.
+
+VERIFY_EXTS = ('.flac', '.mp3', '.ogg')
+
+# Unframed bytes tolerated after the last MP3 frame (Lyrics3 and similar tags)
+MP3_TAIL_SLACK = 2048
+
+# How far back from the end to look for the final FLAC frame when
+# STREAMINFO does not give a maximum frame size
+FLAC_TAIL_WINDOW = 1024 * 1024
+
+FLAC_TOOL_TIMEOUT = 600
+
+
+# --- CRCs ---
+
+def _crc_table(poly, width):
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for i in range(256):
+        c = i << (width - 8)
+        for _ in range(8):
+            c = ((c << 1) ^ poly) if c & top else (c << 1)
+        table.append(c & mask)
+    return table
+
+
+_CRC8 = _crc_table(0x07, 8)
+_CRC16 = _crc_table(0x8005, 16)
+
+
+def crc8(data):
+    c = 0
+    for b in data:
+        c = _CRC8[c ^ b]
+    return c
+
+
+def crc16(data):
+    c = 0
+    for b in data:
+        c = ((c << 8) & 0xffff) ^ _CRC16[(c >> 8) ^ b]
+    return c
+
+
+# Ogg uses the non-reflected CRC-32 (poly 0x04c11db7, init 0, no final xor).
+# It equals the bit-reversed zlib (reflected) CRC of the bit-reversed bytes,
+# which keeps the per-byte work in C.
+_BITREV = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def ogg_crc(data):
+    raw = zlib.crc32(data.translate(_BITREV), 0xffffffff) ^ 0xffffffff
+    return int(f"{raw:032b}"[::-1], 2)
+
+
+# --- Trailing tags ---
+
+def audio_end(mm, start, size):
+    """ End of the audio data: size minus a trailing ID3v1 and/or APEv2 tag """
+    end = size
+    if end - 128 >= start and mm[end - 128:end - 125] == b"TAG":
+        end -= 128
+    if end - 32 >= start and mm[end - 32:end - 24] == b"APETAGEX":
+        ape_size, ape_flags = struct.unpack("<I4xI", mm[end - 20:end - 8])
+        end -= ape_size + (32 if ape_flags & 0x80000000 else 0)
+    return max(start, end)
+
+
+# --- FLAC ---
+
+def _utf8_number(buf, pos):
+    """ FLAC's UTF-8-style coded frame/sample number: (value, next_pos) or None """
+    if pos >= len(buf):
+        return None
+    first = buf[pos]
+    if first < 0x80:
+        return first, pos + 1
+    n = 0
+    mask = 0x80
+    while first & mask:
+        n += 1
+        mask >>= 1
+    if n < 2 or n > 7 or pos + n > len(buf):
+        return None
+    value = first & (mask - 1)
+    for b in buf[pos + 1:pos + n]:
+        if b & 0xc0 != 0x80:
+            return None
+        value = (value << 6) | (b & 0x3f)
+    return value, pos + n
+
+
+def parse_flac_frame_header(buf, pos):
+    """
+    Frame header at buf[pos:]. Returns (variable_blocksize, number, block_size,
+    header_length) or None unless sync, reserved bits and CRC-8 all check out.
+    """
+    if pos + 6 > len(buf) or buf[pos] != 0xff or buf[pos + 1] & 0xfe != 0xf8:
+        return None
+    variable = buf[pos + 1] & 0x1
+    bs_code = buf[pos + 2] >> 4
+    sr_code = buf[pos + 2] & 0xf
+    if bs_code == 0 or sr_code == 15 or buf[pos + 3] & 0x1 or (buf[pos + 3] >> 4) > 10:
+        return None
+    coded = _utf8_number(buf, pos + 4)
+    if coded is None:
+        return None
+    number, p = coded
+    if bs_code == 1:
+        block_size = 192
+    elif bs_code <= 5:
+        block_size = 576 << (bs_code - 2)
+    elif bs_code == 6:
+        block_size = buf[p] + 1
+        p += 1
+    elif bs_code == 7:
+        block_size = int.from_bytes(buf[p:p + 2], "big") + 1
+        p += 2
+    else:
+        block_size = 256 << (bs_code - 8)
+    if sr_code == 12:
+        p += 1
+    elif sr_code in (13, 14):
+        p += 2
+    if p >= len(buf) or crc8(buf[pos:p]) != buf[p]:
+        return None
+    return variable, number, block_size, p + 1 - pos
+
+
+def verify_flac(mm, size, check_md5=False, path=None):
+    parsed = read_flac_blocks(mm)
+    if parsed is None:
+        return "FLAC metadata chain is broken"
+    blocks, audio_offset = parsed
+    if not blocks or blocks[0][0] != 0:
+        return "STREAMINFO block missing"
+    streaminfo = blocks[0][2]
+    max_block = int.from_bytes(streaminfo[2:4], "big")
+    max_frame = int.from_bytes(streaminfo[7:10], "big")
+    total_samples = parse_streaminfo(streaminfo)[3]
+
+    first = parse_flac_frame_header(mm, audio_offset)
+    if first is None:
+        return f"no audio frame at offset {audio_offset}"
+
+    # The final frame must end exactly where the audio ends (EOF, or a trailing
+    # ID3v1/APE tag some taggers append): its CRC-16 covers header + data
+    end = audio_end(mm, audio_offset, size)
+    window = max(2 * max_frame, 64 * 1024) if max_frame else FLAC_TAIL_WINDOW
+    lo = max(audio_offset, end - window)
+    tail = mm[lo:end]
+    last = None
+    pos = tail.rfind(b"\xff")
+    while pos != -1:
+        hdr = parse_flac_frame_header(tail, pos)
+        if hdr and crc16(tail[pos:-2]) == int.from_bytes(tail[-2:], "big"):
+            last = hdr
+            break
+        pos = tail.rfind(b"\xff", 0, pos)
+    if last is None:
+        return "last frame is incomplete (file truncated)"
+
+    variable, number, block_size, _ = last
+    end_sample = (number if variable else number * max_block) + block_size
+    if total_samples and end_sample != total_samples:
+        return f"{end_sample} of {total_samples} samples present"
+
+    if check_md5:
+        return _flac_tool_test(path)
+    return None
+
+
+def _flac_tool_test(path):
+    tool = shutil.which("flac")
+    if tool is None:
+        return None  # reported once by the caller
+    try:
+        proc = subprocess.run([tool, "--test", "--silent", path], capture_output=True,
+                              text=True, errors="replace", timeout=FLAC_TOOL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return "MD5 check timed out"
+    if proc.returncode != 0:
+        lines = [l.strip() for l in proc.stderr.splitlines() if l.strip()]
+        return "MD5 check failed" + (f": {lines[-1][-200:]}" if lines else "")
+    return None
+
+
+# --- MP3 ---
+
+def verify_mp3(mm, size):
+    pos = id3_size(mm)
+    end = audio_end(mm, pos, size)
+
+    # First frame: allow some padding/junk before it, as players do
+    start = mm.find(b"\xff", pos, min(end, pos + 64 * 1024))
+    first = None
+    while start != -1:
+        first = parse_mp3_header(mm[start:start + 4])
+        if first:
+            nxt = start + first["length"]
+            second = parse_mp3_header(mm[nxt:nxt + 4]) if nxt + 4 <= end else None
+            if nxt == end or second:
+                break
+        start = mm.find(b"\xff", start + 1, min(end, pos + 64 * 1024))
+        first = None
+    if first is None:
+        return "no MPEG audio frames found"
+
+    stream = (first["version"], first["layer"], first["sample_rate"])
+    side = (17 if first["mono"] else 32) if first["version"] == 1 else (9 if first["mono"] else 17)
+    xing = mm[start + 4 + side:start + 4 + side + 12]
+    xing_frames = None
+    if xing[:4] in (b"Xing", b"Info") and struct.unpack(">I", xing[4:8])[0] & 0x1:
+        xing_frames = struct.unpack(">I", xing[8:12])[0]
+
+    frames = 0
+    pos = start
+    while pos + 4 <= end:
+        hdr = parse_mp3_header(mm[pos:pos + 4])
+        if hdr is None or (hdr["version"], hdr["layer"], hdr["sample_rate"]) != stream:
+            if end - pos <= MP3_TAIL_SLACK:
+                break
+            return f"frame sync lost at offset {pos} ({100 * (pos - start) // max(1, end - start)}% into audio)"
+        if pos + hdr["length"] > end:
+            return "last frame is incomplete (file truncated)"
+        pos += hdr["length"]
+        frames += 1
+
+    # Encoders differ on whether the Xing frame counts itself; accept either
+    if xing_frames and frames < xing_frames:
+        return f"{frames} of {xing_frames} frames present"
+    return None
+
+
+# --- Ogg ---
+
+def verify_ogg(mm, size):
+    pos = 0
+    sequences = {}
+    eos = set()
+    pages = 0
+    while pos < size:
+        if mm[pos:pos + 4] != b"OggS":
+            return f"lost page sync at offset {pos}"
+        if pos + 27 > size:
+            return "last page is incomplete (file truncated)"
+        header_type = mm[pos + 5]
+        serial, seq, crc = struct.unpack("<III", mm[pos + 14:pos + 26])
+        nsegs = mm[pos + 26]
+        body = sum(mm[pos + 27:pos + 27 + nsegs])
+        page_end = pos + 27 + nsegs + body
+        if page_end > size:
+            return "last page is incomplete (file truncated)"
+        page = bytearray(mm[pos:page_end])
+        page[22:26] = b"\0\0\0\0"
+        if ogg_crc(bytes(page)) != crc:
+            return f"page CRC mismatch at offset {pos}"
+        expected = sequences.get(serial)
+        if expected is not None and seq != expected:
+            return f"page sequence gap at offset {pos} (got {seq}, expected {expected})"
+        sequences[serial] = seq + 1
+        if header_type & 0x4:
+            eos.add(serial)
+        pos = page_end
+        pages += 1
+    if not pages:
+        return "no Ogg pages found"
+    if set(sequences) - eos:
+        return "end-of-stream page missing (file truncated)"
+    return None
+
+
+# --- Driver ---
+
+def verify_file(path, check_md5=False):
+    """
+    Check one file. Returns (path, problem) where problem is None when the
+    file is intact or of a type that is not checked.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in VERIFY_EXTS:
+        return path, None
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return path, "empty file"
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if ext == ".flac":
+                return path, verify_flac(mm, size, check_md5, path)
+            if ext == ".mp3":
+                return path, verify_mp3(mm, size)
+            return path, verify_ogg(mm, size)
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        return path, f"unreadable: {e}"
+
+
+def verify_files(paths, check_md5=False, workers=None):
+    """ {path: problem} for every file that failed, checked in a process pool """
+    paths = [p for p in paths if p.lower().endswith(VERIFY_EXTS)]
+    if not paths:
+        return {}
+    if check_md5 and shutil.which("flac") is None:
+        print("[!] 'flac' not found on PATH; FLAC MD5 signatures are not checked.")
+    workers = workers or os.cpu_count() or 1
+    problems = {}
+    if workers == 1 or len(paths) == 1:
+        results = (verify_file(p, check_md5) for p in paths)
+        for path, problem in results:
+            if problem:
+                problems[path] = problem
+        return problems
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(paths) // (workers * 8))
+        for path, problem in pool.map(verify_file, paths, [check_md5] * len(paths), chunksize=chunksize):
+            if problem:
+                problems[path] = problem
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="verify.py",
+                                     description="Check decrypted FLAC/MP3/Ogg files for truncation and corruption.")
+    parser.add_argument("paths", nargs="+", help="files or folders (e.g. the 'output' folder)")
+    parser.add_argument("--md5", action="store_true", help="also check FLAC MD5 signatures (needs 'flac', decodes audio)")
+    parser.add_argument("--workers", type=int, help="parallel processes (default: one per CPU)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    files = []
+    for p in args.paths:
+        if os.path.isdir(p):
+            files.extend(os.path.join(p, f) for f in sorted(os.listdir(p)))
+        else:
+            files.append(p)
+    checked = [f for f in files if f.lower().endswith(VERIFY_EXTS)]
+    problems = verify_files(checked, args.md5, args.workers)
+    for path, problem in problems.items():
+        print(f"[CORRUPT] {path}: {problem}")
+    print(f"{len(checked)} files checked, {len(problems)} failed.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import sys
+
+# Verify decrypted audio (see unlock_music/verify.py).
+
+from unlock_music.verify import main
+
+if __name__ == "__main__":
+    sys.exit(main())